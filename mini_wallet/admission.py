@@ -0,0 +1,227 @@
+"""
+Admission control of the authenticated routes: a token bucket per token and a
+cap on the requests in flight per wallet.
+
+Checked by validate_token once the customer of the token is known, before the
+route touches the database, so one integration flooding the API is turned
+away with a 429 instead of holding pool connections the others need. The
+limits default to the RATE_LIMIT_* and WALLET_CONCURRENCY_LIMIT settings and
+are overridden per customer in the customer table, see
+`flask set-customer-limits`.
+
+MemoryLimiter keeps the state in the process, so each worker process applies
+the limits on its own; RedisLimiter shares it across the processes, and lets
+requests through when Redis fails rather than failing them.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryLimiter:
+    """Token buckets and in-flight counts of this process.
+
+    At most ``maxsize`` buckets are kept, the least recently used one is
+    dropped first and starts full again on its next request.
+    """
+
+    def __init__(self, maxsize=100000, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.timer = timer
+        # key -> (tokens, updated_at)
+        self._buckets = OrderedDict()
+        self._in_flight = dict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Seconds to wait before a request of key is let through, 0 for now."""
+        now = self.timer()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def enter(self, key, limit):
+        """Count a request of key in flight unless limit already are."""
+        with self._lock:
+            count = self._in_flight.get(key, 0)
+            if count >= limit:
+                return False
+            self._in_flight[key] = count + 1
+            return True
+
+    def leave(self, key):
+        with self._lock:
+            count = self._in_flight.pop(key) - 1
+            if count:
+                self._in_flight[key] = count
+
+
+# KEYS[1] bucket, ARGV rate and burst; the clock of the Redis server is used so
+# the workers agree on it, the wait is returned as a string as Lua numbers
+# come back truncated to integers
+TAKE = """
+redis.replicate_commands()
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+# KEYS[1] in-flight count, ARGV limit and ttl; the ttl bounds how long the
+# slots of a worker killed mid-request stay taken
+ENTER = """
+local count = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if count > tonumber(ARGV[1]) then
+    redis.call('DECR', KEYS[1])
+    return 0
+end
+return 1
+"""
+
+LEAVE = """
+if redis.call('DECR', KEYS[1]) <= 0 then
+    redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLimiter:
+    """MemoryLimiter counterpart kept in Redis, shared by all the app processes.
+
+    Errors listed in ``errors`` are logged and the request let through.
+    """
+
+    def __init__(self, client, prefix="mini_wallet:admission:", ttl=60, errors=()):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.errors = errors
+        self._take = client.register_script(TAKE)
+        self._enter = client.register_script(ENTER)
+        self._leave = client.register_script(LEAVE)
+
+    def _key(self, kind, key):
+        return "{}{}:{}".format(self.prefix, kind, key)
+
+    def take(self, key, rate, burst):
+        try:
+            return float(self._take(keys=[self._key("rate", key)], args=[rate, burst]))
+        except self.errors:
+            logger.warning("redis rate limit fails", exc_info=True)
+            return 0.0
+
+    def enter(self, key, limit):
+        try:
+            return bool(
+                self._enter(keys=[self._key("in_flight", key)], args=[limit, self.ttl])
+            )
+        except self.errors:
+            logger.warning("redis concurrency limit fails", exc_info=True)
+            # counted as entered, leave() gives the slot back all the same
+            return True
+
+    def leave(self, key):
+        try:
+            self._leave(keys=[self._key("in_flight", key)])
+        except self.errors:
+            logger.warning("redis concurrency limit fails", exc_info=True)
+
+
+def redis_limiter(url, ttl=60):
+    # optional dependency, only needed for this backend
+    import redis
+
+    return RedisLimiter(redis.Redis.from_url(url), ttl=ttl, errors=(redis.RedisError,))
+
+
+class Rejected(Exception):
+    """Request turned away, to be retried after retry_after seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def override(value, default):
+    """The limit of a customer, None when unset falls back to the default."""
+    return default if value is None else value
+
+
+class Admission:
+    """Applies the limits of a customer with a limiter backend.
+
+    A limit of 0, by default or for a customer, turns that limit off, so a
+    customer is exempted with a rate and a concurrency limit of 0.
+    """
+
+    def __init__(self, limiter, rate, burst, concurrency):
+        self.limiter = limiter
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.rejected = {"rate": 0, "concurrency": 0}
+        self._lock = threading.Lock()
+
+    def _reject(self, reason, message, retry_after):
+        with self._lock:
+            self.rejected[reason] += 1
+        # whole seconds, as Retry-After takes
+        raise Rejected(message, max(1, math.ceil(retry_after)))
+
+    def enter(self, token, customer_dict):
+        """Admit a request of the customer, raises Rejected otherwise.
+
+        An admitted request must be followed by leave(customer_dict).
+        """
+        rate = override(customer_dict["rate_limit"], self.rate)
+        burst = override(customer_dict["rate_limit_burst"], self.burst)
+        if rate:
+            wait = self.limiter.take(token, rate, max(burst, 1))
+            if wait:
+                self._reject(
+                    "rate",
+                    "rate limit of {} requests per second exceeded".format(rate),
+                    wait,
+                )
+        concurrency = override(customer_dict["concurrency_limit"], self.concurrency)
+        if concurrency and not self.limiter.enter(customer_dict["id"], concurrency):
+            self._reject(
+                "concurrency",
+                "limit of {} concurrent requests per wallet exceeded".format(
+                    concurrency
+                ),
+                1,
+            )
+
+    def leave(self, customer_dict):
+        if override(customer_dict["concurrency_limit"], self.concurrency):
+            self.limiter.leave(customer_dict["id"])
@@ -0,0 +1,518 @@
+"""
+ASGI entry point serving the /api/v1 wallet routes on asyncpg.
+
+A single process keeps thousands of requests in flight while they wait on
+Postgres, the Flask app in views.py needs a worker per in-flight request.
+
+    uvicorn mini_wallet.asgi:app
+"""
+import asyncio
+import logging
+import random
+import re
+import secrets
+import uuid
+from functools import wraps
+
+import asyncpg
+import jsend
+from flask import json
+from marshmallow import ValidationError
+from sqlalchemy.engine.url import make_url
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from webargs.core import dict2schema
+
+from mini_wallet import config
+from mini_wallet import metrics
+from mini_wallet import views
+from mini_wallet.admission import Rejected
+from mini_wallet.views import MiniWalletException
+from mini_wallet.views import WalletBusy
+
+
+app_config = views.app.config
+
+# service layer logger
+logger = logging.getLogger(__name__)
+
+# asyncpg pool, created on startup
+pool = None
+
+
+def positional(statement):
+    """A text() statement with :name binds in asyncpg's $n form."""
+    names = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return "${}".format(names.index(name) + 1)
+
+    return re.sub(r"(?<![:\w]):(\w+)(?!:)", replace, statement.text), names
+
+
+BALANCE_CHANGE_STATEMENTS = {
+    (type_, sharded): positional(views.balance_change_statement(type_, sharded))
+    for type_ in ("deposit", "withdrawal")
+    for sharded in (False, True)
+}
+ENABLE_WALLET = positional(views.ENABLE_WALLET)
+FIND_BALANCE_CHANGE = positional(views.FIND_BALANCE_CHANGE)
+FIND_WALLET = positional(views.FIND_WALLET)
+
+
+async def fetchrow(connection, statement, params):
+    sql, names = statement
+    return await connection.fetchrow(sql, *[params[name] for name in names])
+
+
+async def connect():
+    global pool
+    # migrated by the deploy, see `flask db-upgrade`
+    await run_in_threadpool(views.check_db_revision)
+    url = make_url(app_config["SQLALCHEMY_DATABASE_URI"])
+    url.drivername = "postgresql"
+    pool = await asyncpg.create_pool(str(url), **config.asyncpg_options(app_config))
+
+
+async def disconnect():
+    await pool.close()
+
+
+async def with_lock_retries(operation, attempt):
+    """await attempt(connection) in a transaction bounding its lock waits.
+
+    The asyncio counterpart of views.with_lock_retries, with the same
+    WALLET_LOCK_* settings.
+    """
+    timeout = app_config["WALLET_LOCK_TIMEOUT"]
+    retries = app_config["WALLET_LOCK_RETRIES"]
+    backoff = app_config["WALLET_LOCK_BACKOFF"] / 1000
+    for retry in range(retries + 1):
+        try:
+            async with pool.acquire() as connection:
+                async with connection.transaction():
+                    if timeout:
+                        await connection.execute(
+                            "SET LOCAL lock_timeout = {:d}".format(timeout)
+                        )
+                    result = await attempt(connection)
+        except asyncpg.PostgresError as e:
+            reason = views.RETRYABLE_LOCK_ERRORS.get(e.sqlstate)
+            if reason is None:
+                raise
+            if retry == retries:
+                metrics.wallet_lock_retries.observe(retry, (operation, "gave_up"))
+                raise WalletBusy(operation, reason, retries)
+            logger.info("%s fails on %s, retrying", operation, reason)
+            await asyncio.sleep(random.uniform(0, backoff * 2 ** retry))
+        else:
+            metrics.wallet_lock_retries.observe(retry, (operation, "completed"))
+            return result
+
+
+################################################################################
+
+
+async def forget_wallet_view(customer_id):
+    """Drop the wallet view the Flask app may have cached in a shared backend.
+
+    The backend client blocks, it runs in the threadpool.
+    """
+    if views.balance_cache:
+        await run_in_threadpool(views.balance_cache.invalidate, customer_id)
+
+
+async def get_customer_info_by_token(token):
+    customer_dict = views.token_cache.get(token)
+    if customer_dict is None:
+        if views.unknown_token_cache.get(token):
+            return None
+        customer = await pool.fetchrow(
+            """
+            SELECT id, xid, rate_limit, rate_limit_burst, concurrency_limit
+            FROM customer WHERE token = $1
+            """,
+            token,
+        )
+        if not customer:
+            views.unknown_token_cache.set(token, True)
+            return None
+        customer_dict = views.CustomerContext(*customer.values())
+        views.token_cache.set(token, customer_dict)
+    return customer_dict
+
+
+async def initialize_customer(customer_xid):
+    token = secrets.token_hex(21)
+    try:
+        await pool.execute(
+            "INSERT INTO customer (xid, token) VALUES ($1, $2)", customer_xid, token
+        )
+    except asyncpg.UniqueViolationError:
+        raise MiniWalletException(
+            "customer with customer_id={} already initialized".format(customer_xid)
+        )
+    return {"token": token}
+
+
+async def enable_or_create(customer_dict):
+    customer_id = customer_dict["id"]
+    wallet = await fetchrow(
+        pool, ENABLE_WALLET, {"xid": str(uuid.uuid4()), "customer_id": customer_id}
+    )
+    if not wallet:
+        wallet = await fetchrow(pool, FIND_WALLET, {"customer_id": customer_id})
+        raise MiniWalletException(
+            "wallet with wallet_id={} already enabled".format(wallet["id"])
+        )
+    data = {
+        "wallet": {
+            "xid": wallet["xid"],
+            "customer": customer_dict["xid"],
+            "status": wallet["status"],
+            "enabled_at": wallet["enabled_at"],
+            "balance": wallet["balance"],
+        }
+    }
+    await forget_wallet_view(customer_id)
+    logger.debug(data)
+    return data
+
+
+async def get_balance(customer_dict):
+    customer_id = customer_dict["id"]
+    wallet = await fetchrow(pool, FIND_WALLET, {"customer_id": customer_id})
+    if not wallet:
+        raise MiniWalletException(
+            "wallet with customer_id={} not found".format(customer_id)
+        )
+    if wallet["status"] != "enabled":
+        raise MiniWalletException(
+            "wallet with wallet_id={} not enabled".format(wallet["id"])
+        )
+    data = {
+        "wallet": {
+            "xid": wallet["xid"],
+            "customer": wallet["customer_xid"],
+            "status": wallet["status"],
+            "balance": wallet["balance"],
+        }
+    }
+    logger.debug(data)
+    return data
+
+
+async def find_balance_change(customer_id, amount, reference_id, type_):
+    entry = views.balance_change_cache.get(reference_id)
+    if entry is None:
+        row = await fetchrow(pool, FIND_BALANCE_CHANGE, {"reference_id": reference_id})
+        if not row:
+            return None
+        entry = views.balance_change_entry(row, reference_id)
+        views.balance_change_cache.set(reference_id, entry)
+    return views.replay_balance_change(entry, customer_id, amount, reference_id, type_)
+
+
+async def apply_balance_change(customer_dict, amount, reference_id, type_):
+    customer_id = customer_dict["id"]
+
+    if amount <= 0:
+        raise MiniWalletException("amount={} must be positive".format(amount))
+    payload = await find_balance_change(customer_id, amount, reference_id, type_)
+    if payload:
+        return payload
+
+    params = {
+        "delta": amount if type_ == "deposit" else -amount,
+        "customer_id": customer_id,
+        "xid": str(uuid.uuid4()),
+        "amount": amount,
+        "reference_id": reference_id,
+        "type": type_,
+    }
+    sharded = bool(views.shard_count_cache.get(customer_id))
+
+    async def attempt(connection):
+        row = await fetchrow(
+            connection, BALANCE_CHANGE_STATEMENTS[type_, sharded], params
+        )
+        if not row:
+            wallet = await fetchrow(
+                connection, FIND_WALLET, {"customer_id": customer_id}
+            )
+            if not wallet or bool(wallet["shard_count"]) == sharded:
+                raise views.balance_change_rejection(wallet, customer_id, amount, type_)
+            views.shard_count_cache.set(customer_id, wallet["shard_count"])
+            row = await fetchrow(
+                connection, BALANCE_CHANGE_STATEMENTS[type_, not sharded], params
+            )
+        return row
+
+    try:
+        row = await with_lock_retries(type_, attempt)
+    except asyncpg.UniqueViolationError:
+        payload = await find_balance_change(customer_id, amount, reference_id, type_)
+        if payload:
+            return payload
+        raise MiniWalletException(
+            "{} fails duplicate reference_id={}".format(type_, reference_id)
+        )
+    except asyncpg.NumericValueOutOfRangeError:
+        raise views.balance_out_of_range(type_)
+    if not row:
+        wallet = await fetchrow(pool, FIND_WALLET, {"customer_id": customer_id})
+        raise views.balance_change_rejection(wallet, customer_id, amount, type_)
+    payload = {
+        "xid": row["xid"],
+        "wallet": row["wallet_xid"],
+        "status": "completed",
+        "deposited_at": row["created_at"],
+        "amount": amount,
+        "reference_id": reference_id,
+    }
+    views.balance_change_cache.set(reference_id, (customer_id, type_, amount, payload))
+    await forget_wallet_view(customer_id)
+    return dict(payload)
+
+
+async def deposit_money(customer_dict, amount, reference_id):
+    data = dict()
+    data["deposit"] = await apply_balance_change(
+        customer_dict, amount, reference_id, "deposit"
+    )
+    logger.debug(data)
+    return data
+
+
+async def withdraw_money(customer_dict, amount, reference_id):
+    data = dict()
+    data["withdrawal"] = await apply_balance_change(
+        customer_dict, amount, reference_id, "withdrawal"
+    )
+    return data
+
+
+async def disable_wallet(customer_dict):
+    customer_id = customer_dict["id"]
+    new_status = "disabled"
+
+    async def attempt(connection):
+        wallet = await connection.fetchrow(
+            """
+            SELECT wallet.id, wallet.xid, wallet.status,
+                customer.xid AS customer_xid
+            FROM wallet JOIN customer ON customer.id = wallet.customer_id
+            WHERE wallet.customer_id = $1
+            FOR UPDATE OF wallet
+            """,
+            customer_id,
+        )
+        if not wallet:
+            raise MiniWalletException(
+                "wallet with customer_id={} not found".format(customer_id)
+            )
+        if wallet["status"] == new_status:
+            raise MiniWalletException(
+                "wallet with wallet_id={} already disabled".format(wallet["id"])
+            )
+        await connection.execute(
+            """
+            UPDATE wallet
+            SET status = $1, updated_at = now(), version = version + 1
+            WHERE id = $2
+            """,
+            new_status,
+            wallet["id"],
+        )
+        disabled_at = await connection.fetchval(
+            """
+            INSERT INTO status_change (status, wallet_id) VALUES ($1, $2)
+            RETURNING created_at
+            """,
+            new_status,
+            wallet["id"],
+        )
+        return wallet, disabled_at
+
+    wallet, disabled_at = await with_lock_retries("disable", attempt)
+    data = {
+        "wallet": {
+            "xid": wallet["xid"],
+            "customer": wallet["customer_xid"],
+            "status": new_status,
+            "disabled_at": disabled_at,
+        }
+    }
+    await forget_wallet_view(customer_id)
+    return data
+
+
+################################################################################
+
+
+class JSendResponse(JSONResponse):
+    """Serialized like the Flask app, datetimes included."""
+
+    def render(self, content):
+        return json.dumps(content).encode("utf-8")
+
+
+class ArgumentError(Exception):
+    def __init__(self, messages):
+        super().__init__(messages)
+        self.messages = messages
+
+
+def create_failed_response(error_message, status_code=400, headers=None):
+    return JSendResponse(
+        jsend.fail({"error": error_message}), status_code, headers=headers
+    )
+
+
+async def handle_argument_error(request, exception):
+    return create_failed_response(exception.messages, 400)
+
+
+async def handle_wallet_busy(request, exception):
+    return create_failed_response(
+        str(exception), 503, headers={"Retry-After": str(exception.retry_after)}
+    )
+
+
+async def handle_mini_wallet_error(request, exception):
+    return create_failed_response(str(exception), 400)
+
+
+async def handle_error_500(request, exception):
+    return create_failed_response(str(exception), 500)
+
+
+async def parse_args(request, argmap):
+    """Validate the form or JSON body against a webargs argmap of views.py."""
+    if request.headers.get("content-type", "").startswith("application/json"):
+        body = await request.json()
+    else:
+        body = await request.form()
+    try:
+        result = dict2schema(argmap)().load(
+            {name: body[name] for name in argmap if name in body}
+        )
+    except ValidationError as e:
+        raise ArgumentError(e.messages)
+    # marshmallow 2 returns an UnmarshalResult
+    return getattr(result, "data", result)
+
+
+def use_args(argmap):
+    """Pass the parsed body on, checked before the token as in the Flask app."""
+
+    def decorator(f):
+        @wraps(f)
+        async def wrap(request, *args):
+            parsed = await parse_args(request, argmap)
+            return await f(request, parsed, *args)
+
+        return wrap
+
+    return decorator
+
+
+def validate_token(f):
+    @wraps(f)
+    async def wrap(request, *args):
+        authorization = request.headers.get("Authorization")
+        if not authorization or not authorization.startswith("Token "):
+            return create_failed_response(
+                "Incorrect Authorization signature: 'Token <my token>'", 401
+            )
+
+        _, token = authorization.split(" ")
+        customer_dict = await get_customer_info_by_token(token)
+        if not customer_dict:
+            return create_failed_response(
+                "Incorrect Authorization signature: 'Token <my token>'", 401
+            )
+
+        # the limiter may wait on Redis, it runs in the threadpool
+        admission = views.customer_admission
+        if admission:
+            try:
+                await run_in_threadpool(admission.enter, token, customer_dict)
+            except Rejected as e:
+                return create_failed_response(
+                    str(e), 429, headers={"Retry-After": str(e.retry_after)}
+                )
+        try:
+            return await f(request, *args, customer_dict)
+        finally:
+            if admission:
+                await run_in_threadpool(admission.leave, customer_dict)
+
+    return wrap
+
+
+################################################################################
+
+
+async def initialize(request):
+    args = await parse_args(request, views.initialize_args)
+    data = await initialize_customer(args["customer_xid"])
+    return JSendResponse(jsend.success(data), 201)
+
+
+@validate_token
+async def enable(request, customer_dict):
+    data = await enable_or_create(customer_dict)
+    return JSendResponse(jsend.success(data), 201)
+
+
+@validate_token
+async def view(request, customer_dict):
+    data = await get_balance(customer_dict)
+    return JSendResponse(jsend.success(data), 200)
+
+
+@use_args(views.balance_change_args)
+@validate_token
+async def deposit(request, args, customer_dict):
+    data = await deposit_money(customer_dict, args["amount"], args["reference_id"])
+    return JSendResponse(jsend.success(data), 201)
+
+
+@use_args(views.balance_change_args)
+@validate_token
+async def withdraw(request, args, customer_dict):
+    data = await withdraw_money(customer_dict, args["amount"], args["reference_id"])
+    return JSendResponse(jsend.success(data), 201)
+
+
+@use_args(views.disable_args)
+@validate_token
+async def disable(request, args, customer_dict):
+    data = await disable_wallet(customer_dict)
+    return JSendResponse(jsend.success(data), 201)
+
+
+app = Starlette(
+    routes=[
+        Route("/api/v1/init", initialize, methods=["POST"]),
+        Route("/api/v1/wallet", enable, methods=["POST"]),
+        Route("/api/v1/wallet", view, methods=["GET"]),
+        Route("/api/v1/wallet", disable, methods=["PATCH"]),
+        Route("/api/v1/wallet/deposits", deposit, methods=["POST"]),
+        Route("/api/v1/wallet/withdrawals", withdraw, methods=["POST"]),
+    ],
+    exception_handlers={
+        ArgumentError: handle_argument_error,
+        WalletBusy: handle_wallet_busy,
+        MiniWalletException: handle_mini_wallet_error,
+        Exception: handle_error_500,
+    },
+    on_startup=[connect],
+    on_shutdown=[disconnect],
+)
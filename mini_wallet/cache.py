@@ -0,0 +1,199 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe bounded LRU cache whose entries expire after ``ttl`` seconds.
+
+    A ``maxsize`` of 0 disables caching, every lookup is then a miss.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self.timer():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.timer() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > self.timer()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """LRUCache counterpart kept in Redis, shared by all the app processes.
+
+    Values are stored as JSON and expire after ``ttl`` seconds, eviction is
+    left to the server's maxmemory-policy. Errors listed in ``errors`` are
+    logged and handled as misses.
+    """
+
+    def __init__(self, client, ttl=60, prefix="mini_wallet:", errors=()):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.errors = errors
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _key(self, key):
+        return "{}{}".format(self.prefix, key)
+
+    def get(self, key, default=None):
+        try:
+            value = self.client.get(self._key(key))
+        except self.errors:
+            logger.warning("redis get fails", exc_info=True)
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        try:
+            self.client.set(self._key(key), json.dumps(value), ex=self.ttl)
+        except self.errors:
+            logger.warning("redis set fails", exc_info=True)
+
+    def delete(self, key):
+        try:
+            self.client.delete(self._key(key))
+        except self.errors:
+            logger.warning("redis delete fails", exc_info=True)
+
+    def __contains__(self, key):
+        try:
+            return bool(self.client.exists(self._key(key)))
+        except self.errors:
+            logger.warning("redis exists fails", exc_info=True)
+            # refreshed anyway, a stale entry must not survive a write
+            return True
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self._key("*")):
+            self.client.delete(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "ttl": self.ttl,
+            }
+
+
+def redis_cache(url, ttl=60, prefix="mini_wallet:"):
+    # optional dependency, only needed for this backend
+    import redis
+
+    return RedisCache(
+        redis.Redis.from_url(url), ttl=ttl, prefix=prefix, errors=(redis.RedisError,)
+    )
+
+
+class WriteThroughCache:
+    """Cache of load(key), refreshed by the writers right after they commit.
+
+    Filling a missing key and a writer's refresh of the same key both load
+    under the key's lock, so a load that read the row before a commit cannot
+    overwrite what the writer stores after it. Hits read the backend without
+    the lock: between a writer's commit and its refresh, concurrent readers
+    are served the value from before the commit. Once the writer has
+    refreshed, which it does before answering its own request, no older value
+    is served within the process.
+    """
+
+    def __init__(self, backend, load, stripes=64):
+        self.backend = backend
+        self.load = load
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _lock(self, key):
+        return self._locks[hash(key) % len(self._locks)]
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            with self._lock(key):
+                value = self._fill(key)
+        return value
+
+    def refresh(self, key):
+        """Called after a commit changing key, reloads it when cached."""
+        with self._lock(key):
+            if key in self.backend:
+                self._fill(key)
+
+    def invalidate(self, key):
+        self.backend.delete(key)
+
+    def _fill(self, key):
+        value = self.load(key)
+        if value is None:
+            self.backend.delete(key)
+        else:
+            self.backend.set(key, value)
+        return value
+
+    def stats(self):
+        return self.backend.stats()
@@ -0,0 +1,55 @@
+import threading
+from concurrent.futures import Future
+
+
+class GroupCommitter:
+    """Applies calls made concurrently for the same key in one go.
+
+    The first caller for a key leads the group: it waits up to ``window``
+    seconds, or until ``max_size`` items are queued, then passes all the items
+    to ``apply(key, items)``, which returns one result per item. Every caller
+    gets back its own result, or the exception apply raised.
+    """
+
+    def __init__(self, apply, window=0.002, max_size=100):
+        self.apply = apply
+        self.window = window
+        self.max_size = max_size
+        # key -> group still accepting items
+        self._groups = dict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, item):
+        future = Future()
+        with self._lock:
+            group = self._groups.get(key)
+            leader = group is None
+            if leader:
+                group = self._groups[key] = _Group()
+            group.entries.append((item, future))
+            if len(group.entries) >= self.max_size:
+                del self._groups[key]
+                group.full.set()
+        if leader:
+            group.full.wait(self.window)
+            with self._lock:
+                if self._groups.get(key) is group:
+                    del self._groups[key]
+            self._apply(key, group.entries)
+        return future.result()
+
+    def _apply(self, key, entries):
+        try:
+            results = self.apply(key, [item for item, _ in entries])
+        except Exception as e:
+            for _, future in entries:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(entries, results):
+            future.set_result(result)
+
+
+class _Group:
+    def __init__(self):
+        self.entries = []
+        self.full = threading.Event()
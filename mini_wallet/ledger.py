@@ -0,0 +1,199 @@
+"""
+Monthly partitions of the balance_change ledger.
+
+Inserts and their index updates only touch the partition of the current
+month. Partitions are created months ahead by create_partitions, run on
+deploy by `flask db-upgrade` and monthly by `flask ledger-partitions`, as an
+insert past the last partition fails. Old partitions are exported to gzipped
+CSV files and dropped by archive_partitions, see `flask archive-ledger`.
+
+reference_id stays unique across partitions through the
+balance_change_reference table, filled by a trigger on insert, which keeps
+the reference_ids of archived partitions.
+"""
+import gzip
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime
+
+from sqlalchemy import exc
+from sqlalchemy.sql import text
+
+
+logger = logging.getLogger(__name__)
+
+
+PARTITIONS = text(
+    """
+    SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+    FROM pg_inherits
+    JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = :table
+    """
+)
+
+UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    month = value.year * 12 + value.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return "{}_p{:%Y%m}".format(table, month)
+
+
+def list_partitions(connection, table="balance_change"):
+    """(name, upper bound) of the partitions of table, oldest first.
+
+    The upper bound is None for a partition bounded by MAXVALUE.
+    """
+    partitions = []
+    for name, bound in connection.execute(PARTITIONS, table=table):
+        match = UPPER_BOUND.search(bound)
+        upper = datetime.fromisoformat(match.group(1)) if match else None
+        partitions.append((name, upper))
+    return sorted(partitions, key=lambda partition: partition[1] or datetime.max)
+
+
+def create_partitions(connection, table="balance_change", months_ahead=2, now=None):
+    """Create the monthly partitions up to months_ahead months from now.
+
+    Starts after the last partition, or at the current month when table has
+    none. now defaults to the database clock, which sets created_at.
+    """
+    with connection.begin():
+        # concurrent callers would both try to create the same partitions
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:table))"), table=table
+        )
+        if now is None:
+            now = connection.execute(text("SELECT LOCALTIMESTAMP")).scalar()
+        partitions = list_partitions(connection, table)
+        if partitions and partitions[-1][1] is None:
+            return []
+        month = partitions[-1][1] if partitions else month_start(now)
+        created = []
+        while month <= add_months(now, months_ahead):
+            name = partition_name(table, month)
+            connection.execute(
+                text(
+                    """
+                    CREATE TABLE {name} PARTITION OF {table}
+                    FOR VALUES FROM ('{start}') TO ('{end}')
+                    """.format(
+                        name=name,
+                        table=table,
+                        start=month.isoformat(" "),
+                        end=add_months(month, 1).isoformat(" "),
+                    )
+                )
+            )
+            created.append(name)
+            month = add_months(month, 1)
+    for name in created:
+        logger.info("created partition %s", name)
+    return created
+
+
+def export_partition(engine, name, path):
+    """Copy the partition to a gzipped CSV file at path, returns the row count.
+
+    Written to a temporary file renamed once synced, a file at path is always
+    a complete export.
+    """
+    partial = path + ".partial"
+    connection = engine.raw_connection()
+    try:
+        with gzip.open(partial, "wb") as f:
+            cursor = connection.cursor()
+            cursor.copy_expert(
+                "COPY {} TO STDOUT WITH (FORMAT csv, HEADER)".format(name), f
+            )
+            rows = cursor.rowcount
+        connection.commit()
+    finally:
+        connection.close()
+    with open(partial, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+    return rows
+
+
+def drop_partition(engine, table, name, rows, path, rollup, lock_timeout):
+    with engine.begin() as connection:
+        # no new rows can land in a past month, the lock makes sure of it
+        connection.execute(text("LOCK TABLE {} IN SHARE MODE".format(name)))
+        count = connection.execute(
+            text("SELECT count(*) FROM {}".format(name))
+        ).scalar()
+        if count != rows:
+            raise RuntimeError(
+                "{} has {} rows, {} exported to {}".format(name, count, rows, path)
+            )
+        if rollup:
+            connection.execute(text(rollup.format(partition=name)))
+        # DETACH locks table in ACCESS EXCLUSIVE mode, queued behind its long
+        # readers it would queue every insert into table behind itself
+        if lock_timeout:
+            connection.execute(
+                text("SET LOCAL lock_timeout = {:d}".format(lock_timeout))
+            )
+        connection.execute(
+            text("ALTER TABLE {} DETACH PARTITION {}".format(table, name))
+        )
+        connection.execute(text("DROP TABLE {}".format(name)))
+
+
+def archive_partitions(
+    engine,
+    before,
+    directory,
+    table="balance_change",
+    rollup=None,
+    lock_timeout=200,
+    retries=10,
+    backoff=0.5,
+):
+    """Export and drop the partitions of table holding rows before before only.
+
+    A partition is dropped once its export holds as many rows as the
+    partition, its rows stay in place otherwise. rollup is a statement run
+    with the partition name as {partition} just before it is dropped, in the
+    same transaction. The drop waits at most lock_timeout milliseconds for
+    its locks, 0 waits forever, and is retried up to retries times after a
+    jittered backoff of backoff seconds doubled every retry. Returns (name,
+    rows, path) of each archived partition.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with engine.connect() as connection:
+        partitions = list_partitions(connection, table)
+    archived = []
+    for name, upper in partitions:
+        if upper is None or upper > before:
+            continue
+        path = os.path.join(directory, "{}.csv.gz".format(name))
+        rows = export_partition(engine, name, path)
+        for retry in range(retries + 1):
+            try:
+                drop_partition(engine, table, name, rows, path, rollup, lock_timeout)
+            except exc.OperationalError as e:
+                # lock_timeout, or a deadlock with a concurrent reader
+                if retry == retries or e.orig.pgcode not in ("55P03", "40P01"):
+                    raise
+                logger.info("dropping partition %s fails on its locks, retrying", name)
+                time.sleep(random.uniform(0, backoff * 2 ** retry))
+            else:
+                break
+        logger.info("archived partition %s, %s rows to %s", name, rows, path)
+        archived.append((name, rows, path))
+    return archived
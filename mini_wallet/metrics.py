@@ -0,0 +1,264 @@
+"""
+In-process metrics rendered in Prometheus text format on GET /metrics.
+
+Observing is a bisect and two additions under a lock, cheap enough to stay on
+in production, see tests/benchmark/bench_metrics_overhead.py.
+"""
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+# seconds, from sub-millisecond pool checkouts up to requests stuck on locks
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# seconds, an outbox event waits at least for the relay poll interval
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+BATCH_BUCKETS = (1, 10, 50, 100, 250, 500, 1000)
+
+REGISTRY = []
+
+
+def format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    return ",".join(
+        '{}="{}"'.format(name, str(value).replace('"', '\\"'))
+        for name, value in zip(labelnames, values)
+    )
+
+
+class Histogram:
+    """Thread-safe cumulative histogram, optionally split by labels."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts, sum]
+        self._series = dict()
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self, labels=()):
+        with self._lock:
+            counts, total = self._series.get(
+                labels, [[0] * (len(self.buckets) + 1), 0.0]
+            )
+            counts = list(counts)
+        cumulative = []
+        running = 0
+        for upper_bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            cumulative.append((upper_bound, running))
+        return {"buckets": cumulative, "count": running, "sum": total}
+
+    def render(self):
+        lines = [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} histogram".format(self.name),
+        ]
+        with self._lock:
+            all_labels = sorted(self._series)
+        if not all_labels and not self.labelnames:
+            all_labels = [()]
+        for labels in all_labels:
+            snapshot = self.snapshot(labels)
+            label_text = format_labels(self.labelnames, labels)
+            for upper_bound, count in snapshot["buckets"]:
+                le = "+Inf" if upper_bound == float("inf") else repr(upper_bound)
+                bucket_labels = 'le="{}"'.format(le)
+                if label_text:
+                    bucket_labels = "{},{}".format(label_text, bucket_labels)
+                lines.append(
+                    "{}_bucket{{{}}} {}".format(self.name, bucket_labels, count)
+                )
+            suffix = "{{{}}}".format(label_text) if label_text else ""
+            lines.append("{}_sum{} {}".format(self.name, suffix, snapshot["sum"]))
+            lines.append("{}_count{} {}".format(self.name, suffix, snapshot["count"]))
+        return "\n".join(lines)
+
+
+class CallbackGauge:
+    """Gauge read at scrape time, collect() yields (label values, value)."""
+
+    def __init__(self, name, documentation, labelnames, collect):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} gauge".format(self.name),
+        ]
+        for labels, value in self.collect():
+            label_text = format_labels(self.labelnames, labels)
+            suffix = "{{{}}}".format(label_text) if label_text else ""
+            lines.append("{}{} {}".format(self.name, suffix, value))
+        return "\n".join(lines)
+
+
+@contextmanager
+def timed(histogram, labels=()):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, labels)
+
+
+def render():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="0.0.0.0"):
+    """Serve the metrics on any path from a daemon thread, for the workers
+    running outside the Flask app."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+pool_checkout_wait = Histogram(
+    "mini_wallet_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool.",
+)
+
+request_latency = Histogram(
+    "mini_wallet_request_seconds",
+    "Request latency by route.",
+    labelnames=("method", "route", "status"),
+)
+
+request_sql_statements = Histogram(
+    "mini_wallet_request_sql_statements",
+    "SQL statements executed per request.",
+    labelnames=("method", "route"),
+    buckets=COUNT_BUCKETS,
+)
+
+request_sql_time = Histogram(
+    "mini_wallet_request_sql_seconds",
+    "Time spent executing SQL per request.",
+    labelnames=("method", "route"),
+)
+
+wallet_lock = Histogram(
+    "mini_wallet_wallet_lock_seconds",
+    "Duration of the statement taking the wallet row lock, lock wait included.",
+    labelnames=("operation",),
+)
+
+wallet_lock_retries = Histogram(
+    "mini_wallet_wallet_lock_retries",
+    "Retries of a wallet operation after a lock timeout, deadlock or "
+    "serialization failure, by whether it completed or gave up.",
+    labelnames=("operation", "outcome"),
+    buckets=COUNT_BUCKETS,
+)
+
+wallet_version_conflicts = Histogram(
+    "mini_wallet_wallet_version_conflicts",
+    "Version conflicts of an optimistic wallet operation, by whether it "
+    "completed or fell back to locking the wallet.",
+    labelnames=("operation", "outcome"),
+    buckets=COUNT_BUCKETS,
+)
+
+group_commit_size = Histogram(
+    "mini_wallet_group_commit_size",
+    "Deposits applied per group commit.",
+    buckets=COUNT_BUCKETS,
+)
+
+outbox_lag = Histogram(
+    "mini_wallet_outbox_lag_seconds",
+    "Time from the write of an outbox event to its publication.",
+    buckets=LAG_BUCKETS,
+)
+
+outbox_publish = Histogram(
+    "mini_wallet_outbox_publish_seconds",
+    "Duration of the publication of a batch of outbox events to the sink.",
+)
+
+# the sum over time is the relay throughput
+outbox_batch_size = Histogram(
+    "mini_wallet_outbox_batch_size",
+    "Outbox events published per batch.",
+    buckets=BATCH_BUCKETS,
+)
+
+
+class SQLTracker(threading.local):
+    """SQL statements and time of the request handled by the current thread."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+sql_tracker = SQLTracker()
+
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        context.mini_wallet_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        sql_tracker.statements += 1
+        sql_tracker.seconds += time.perf_counter() - context.mini_wallet_started
@@ -1,3 +1,5 @@
+import os
+import sys
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -11,13 +13,24 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-fileConfig(config.config_file_name)
+# Skipped when migrating from within the app, see mini_wallet.views.upgrade_db
+if config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+# make mini_wallet importable when running the alembic command line
+project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(project_dir))
+
+from mini_wallet.views import app, db  # noqa: E402
 
 # add your model's MetaData object here
 # for 'autogenerate' support
-# from myapp import mymodel
-# target_metadata = mymodel.Base.metadata
-target_metadata = None
+target_metadata = db.metadata
+
+# escaped as the option goes through configparser interpolation
+config.set_main_option(
+    "sqlalchemy.url", app.config["SQLALCHEMY_DATABASE_URI"].replace("%", "%%")
+)
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
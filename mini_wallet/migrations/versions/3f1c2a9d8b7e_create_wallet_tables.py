@@ -0,0 +1,83 @@
+"""create wallet tables
+
+Matches the schema db.create_all() used to build, a database created that
+way can be adopted with `alembic stamp 3f1c2a9d8b7e`.
+
+Revision ID: 3f1c2a9d8b7e
+Revises:
+Create Date: 2026-10-18 10:02:11.482305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3f1c2a9d8b7e"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "customer",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True
+        ),
+        sa.Column("xid", sa.Text(), nullable=False),
+        sa.Column("token", sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("token"),
+        sa.UniqueConstraint("xid"),
+    )
+    op.create_table(
+        "wallet",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True
+        ),
+        sa.Column(
+            "updated_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True
+        ),
+        sa.Column("xid", sa.Text(), nullable=False),
+        sa.Column("balance", sa.Numeric(), nullable=False),
+        sa.Column("status", sa.Text(), nullable=False),
+        sa.Column("customer_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["customer_id"], ["customer.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "balance_change",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True
+        ),
+        sa.Column("xid", sa.Text(), nullable=False),
+        sa.Column("amount", sa.Numeric(), nullable=False),
+        sa.Column("reference_id", sa.Text(), nullable=False),
+        sa.Column("type", sa.Text(), nullable=False),
+        sa.Column("wallet_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["wallet_id"], ["wallet.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("reference_id"),
+    )
+    op.create_table(
+        "status_change",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True
+        ),
+        sa.Column("status", sa.Text(), nullable=False),
+        sa.Column("wallet_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["wallet_id"], ["wallet.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade():
+    op.drop_table("status_change")
+    op.drop_table("balance_change")
+    op.drop_table("wallet")
+    op.drop_table("customer")
@@ -0,0 +1,32 @@
+"""add wallet version
+
+Version of the wallet row, bumped by every write to it, for the optimistic
+WALLET_CONCURRENCY_MODE, a bigint as a busy wallet would run through an
+integer. The constant default is stored in the catalog, the table is not
+rewritten.
+
+Revision ID: 4e8a2d6f0c19
+Revises: 7b3f9c1e5d24
+Create Date: 2026-10-18 20:03:48.215730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4e8a2d6f0c19"
+down_revision = "7b3f9c1e5d24"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "wallet",
+        sa.Column("version", sa.BigInteger(), server_default="0", nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_column("wallet", "version")
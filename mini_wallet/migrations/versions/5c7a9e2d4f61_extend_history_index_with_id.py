@@ -0,0 +1,48 @@
+"""extend history index with id
+
+Keyset pagination of the transaction history orders by (created_at, id), the
+index gets id appended so a page is read straight off the index.
+
+Revision ID: 5c7a9e2d4f61
+Revises: 8d4e6b1f2c3a
+Create Date: 2026-10-18 11:40:52.117630
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "5c7a9e2d4f61"
+down_revision = "8d4e6b1f2c3a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_balance_change_wallet_id_created_at_id",
+            "balance_change",
+            ["wallet_id", "created_at", "id"],
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_balance_change_wallet_id_created_at",
+            table_name="balance_change",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_balance_change_wallet_id_created_at",
+            "balance_change",
+            ["wallet_id", "created_at"],
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_balance_change_wallet_id_created_at_id",
+            table_name="balance_change",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,36 @@
+"""add customer limits
+
+Per customer overrides of the admission limits, see mini_wallet/admission.py.
+NULL falls back to the app settings. Nullable columns without a default are
+added without rewriting the table.
+
+Revision ID: 7b3f9c1e5d24
+Revises: d91e4b7c3a08
+Create Date: 2026-10-18 19:12:36.540127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7b3f9c1e5d24"
+down_revision = "d91e4b7c3a08"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("customer", sa.Column("rate_limit", sa.Float(), nullable=True))
+    op.add_column(
+        "customer", sa.Column("rate_limit_burst", sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        "customer", sa.Column("concurrency_limit", sa.Integer(), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column("customer", "concurrency_limit")
+    op.drop_column("customer", "rate_limit_burst")
+    op.drop_column("customer", "rate_limit")
@@ -0,0 +1,42 @@
+"""add lookup indexes
+
+Built with CREATE INDEX CONCURRENTLY outside of the migration transaction so
+the ledger tables keep taking writes while the indexes are built. A build
+that fails leaves an INVALID index behind, drop it before running again.
+
+Revision ID: 8d4e6b1f2c3a
+Revises: 3f1c2a9d8b7e
+Create Date: 2026-10-18 10:14:37.905112
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "8d4e6b1f2c3a"
+down_revision = "3f1c2a9d8b7e"
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ("ix_wallet_customer_id", "wallet", ["customer_id"]),
+    ("ix_status_change_wallet_id", "status_change", ["wallet_id"]),
+    (
+        "ix_balance_change_wallet_id_created_at",
+        "balance_change",
+        ["wallet_id", "created_at"],
+    ),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,135 @@
+"""bigint money
+
+Balances and amounts move from numeric to bigint. The API only takes whole
+amounts in the currency's minor unit, so values are copied unchanged.
+
+ALTER COLUMN ... TYPE would rewrite each table under an exclusive lock, so
+instead a bigint column is added next to each numeric one, kept in sync by a
+trigger, backfilled in batches of BATCH_SIZE rows with a commit after each,
+and swapped in with renames once complete. Only the swap locks the tables,
+for as long as the renames take.
+
+Revision ID: a93d5e2c7b48
+Revises: e47a1c9b3f25
+Create Date: 2026-10-18 13:48:12.659204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a93d5e2c7b48"
+down_revision = "e47a1c9b3f25"
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 10000
+
+# table, numeric column, key of the backfill batches
+COLUMNS = [
+    ("wallet", "balance", "id"),
+    ("balance_change", "amount", "id"),
+    ("wallet_balance_shard", "balance", "wallet_id"),
+]
+
+
+def upgrade():
+    connection = op.get_bind()
+    for table, column, _ in COLUMNS:
+        invalid = connection.execute(
+            sa.text(
+                """
+                SELECT count(*) FROM {table}
+                WHERE {column} <> trunc({column})
+                    OR {column} NOT BETWEEN -9223372036854775808
+                        AND 9223372036854775807
+                """.format(
+                    table=table, column=column
+                )
+            )
+        ).scalar()
+        if invalid:
+            raise RuntimeError(
+                "{} rows of {} have a {} that is not a bigint".format(
+                    invalid, table, column
+                )
+            )
+
+    op.execute(
+        """
+        CREATE FUNCTION copy_money_to_bigint() RETURNS trigger AS $$
+        BEGIN
+            NEW := jsonb_populate_record(
+                NEW,
+                jsonb_build_object(
+                    TG_ARGV[1], trunc(CAST(to_jsonb(NEW) ->> TG_ARGV[0] AS numeric))
+                )
+            );
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for table, column, _ in COLUMNS:
+        op.add_column(table, sa.Column(column + "_bigint", sa.BigInteger()))
+        op.execute(
+            """
+            CREATE TRIGGER {table}_{column}_bigint
+            BEFORE INSERT OR UPDATE ON {table}
+            FOR EACH ROW EXECUTE PROCEDURE copy_money_to_bigint({column}, {new})
+            """.format(
+                table=table, column=column, new=column + "_bigint"
+            )
+        )
+
+    with op.get_context().autocommit_block():
+        for table, column, key in COLUMNS:
+            backfill = sa.text(
+                """
+                UPDATE {table} SET {new} = {column}
+                WHERE {key} IN (
+                    SELECT {key} FROM {table} WHERE {new} IS NULL LIMIT :batch_size
+                )
+                """.format(
+                    table=table, column=column, new=column + "_bigint", key=key
+                )
+            )
+            while connection.execute(backfill, batch_size=BATCH_SIZE).rowcount:
+                pass
+            # the validation scan runs without blocking writes, SET NOT NULL
+            # then relies on the validated constraint instead of scanning
+            op.execute(
+                """
+                ALTER TABLE {table} ADD CONSTRAINT {table}_{new}_not_null
+                CHECK ({new} IS NOT NULL) NOT VALID
+                """.format(
+                    table=table, new=column + "_bigint"
+                )
+            )
+            op.execute(
+                "ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{new}_not_null".format(
+                    table=table, new=column + "_bigint"
+                )
+            )
+
+    for table, column, _ in COLUMNS:
+        new = column + "_bigint"
+        op.execute(
+            "DROP TRIGGER {table}_{column}_bigint ON {table}".format(
+                table=table, column=column
+            )
+        )
+        op.alter_column(table, new, nullable=False)
+        op.drop_constraint("{}_{}_not_null".format(table, new), table)
+        op.drop_column(table, column)
+        op.alter_column(table, new, new_column_name=column)
+    op.execute("DROP FUNCTION copy_money_to_bigint()")
+
+
+def downgrade():
+    for table, column, _ in COLUMNS:
+        op.alter_column(
+            table, column, type_=sa.Numeric(), existing_type=sa.BigInteger()
+        )
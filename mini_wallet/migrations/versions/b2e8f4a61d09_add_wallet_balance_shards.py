@@ -0,0 +1,40 @@
+"""add wallet balance shards
+
+High-traffic wallets can have their balance split over wallet_balance_shard
+rows, so concurrent deposits do not all queue on the wallet row. The
+shard_count default is a constant, adding it does not rewrite wallet.
+
+Revision ID: b2e8f4a61d09
+Revises: 5c7a9e2d4f61
+Create Date: 2026-10-18 12:20:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b2e8f4a61d09"
+down_revision = "5c7a9e2d4f61"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "wallet",
+        sa.Column("shard_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.create_table(
+        "wallet_balance_shard",
+        sa.Column("wallet_id", sa.Integer(), nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("balance", sa.Numeric(), nullable=False),
+        sa.ForeignKeyConstraint(["wallet_id"], ["wallet.id"]),
+        sa.PrimaryKeyConstraint("wallet_id", "shard"),
+    )
+
+
+def downgrade():
+    op.drop_table("wallet_balance_shard")
+    op.drop_column("wallet", "shard_count")
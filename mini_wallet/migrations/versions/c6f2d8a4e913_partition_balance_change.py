@@ -0,0 +1,258 @@
+"""partition balance_change by month
+
+balance_change becomes a table partitioned by range of created_at. A
+partitioned table cannot have a unique index without the partition key, so
+reference_id uniqueness moves to the balance_change_reference table, filled
+by a statement trigger on every insert into balance_change.
+
+The existing table is kept as is and attached as the balance_change_legacy
+partition holding everything before next month, monthly partitions follow.
+Like a93d5e2c7b48, the slow steps run before the swap without blocking writes:
+a trigger copies new reference_ids while the existing ones are backfilled in
+batches, and the constraints and indexes the attach would otherwise check or
+build under lock are validated and built concurrently beforehand.
+
+Revision ID: c6f2d8a4e913
+Revises: a93d5e2c7b48
+Create Date: 2026-10-18 15:02:41.318522
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from mini_wallet import ledger
+
+
+# revision identifiers, used by Alembic.
+revision = "c6f2d8a4e913"
+down_revision = "a93d5e2c7b48"
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 10000
+
+# monthly partitions created after the legacy one
+PARTITIONS_AHEAD = 2
+
+CLAIM_REFERENCES = """
+    CREATE FUNCTION claim_balance_change_references() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO balance_change_reference (reference_id, created_at)
+        SELECT reference_id, created_at FROM inserted_balance_change;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+CLAIM_REFERENCES_TRIGGER = """
+    CREATE TRIGGER balance_change_reference
+    AFTER INSERT ON {table}
+    REFERENCING NEW TABLE AS inserted_balance_change
+    FOR EACH STATEMENT EXECUTE PROCEDURE claim_balance_change_references()
+"""
+
+
+def upgrade():
+    connection = op.get_bind()
+    missing = connection.execute(
+        "SELECT count(*) FROM balance_change WHERE created_at IS NULL"
+    ).scalar()
+    if missing:
+        raise RuntimeError(
+            "{} rows of balance_change have no created_at".format(missing)
+        )
+    boundary = ledger.add_months(
+        connection.execute("SELECT LOCALTIMESTAMP").scalar(), 1
+    )
+
+    op.create_table(
+        "balance_change_reference",
+        sa.Column("reference_id", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("reference_id"),
+    )
+    op.execute(CLAIM_REFERENCES)
+    op.execute(CLAIM_REFERENCES_TRIGGER.format(table="balance_change"))
+
+    with op.get_context().autocommit_block():
+        backfill = sa.text(
+            """
+            WITH batch AS (
+                SELECT id, reference_id, created_at
+                FROM balance_change
+                WHERE id > :after
+                ORDER BY id
+                LIMIT :batch_size
+            ), claimed AS (
+                INSERT INTO balance_change_reference (reference_id, created_at)
+                SELECT reference_id, created_at FROM batch
+                ON CONFLICT (reference_id) DO NOTHING
+            )
+            SELECT max(id) FROM batch
+            """
+        )
+        after = 0
+        while after is not None:
+            after = connection.execute(
+                backfill, after=after, batch_size=BATCH_SIZE
+            ).scalar()
+        constraints = [
+            ("balance_change_created_at_not_null", "created_at IS NOT NULL"),
+            (
+                "balance_change_legacy_bound",
+                "created_at < '{}'".format(boundary.isoformat(" ")),
+            ),
+        ]
+        for name, condition in constraints:
+            op.execute(
+                """
+                ALTER TABLE balance_change ADD CONSTRAINT {}
+                CHECK ({}) NOT VALID
+                """.format(
+                    name, condition
+                )
+            )
+            op.execute("ALTER TABLE balance_change VALIDATE CONSTRAINT {}".format(name))
+        # matching the indexes of the partitioned table, attached instead of built
+        op.execute(
+            """
+            CREATE UNIQUE INDEX CONCURRENTLY balance_change_legacy_pkey_new
+            ON balance_change (id, created_at)
+            """
+        )
+        op.execute(
+            """
+            CREATE INDEX CONCURRENTLY balance_change_legacy_reference_id
+            ON balance_change (reference_id)
+            """
+        )
+
+    op.alter_column("balance_change", "created_at", nullable=False)
+    op.drop_constraint("balance_change_created_at_not_null", "balance_change")
+    op.execute("DROP TRIGGER balance_change_reference ON balance_change")
+    op.rename_table("balance_change", "balance_change_legacy")
+    op.execute(
+        """
+        ALTER TABLE balance_change_legacy
+        DROP CONSTRAINT balance_change_pkey,
+        DROP CONSTRAINT balance_change_reference_id_key,
+        ADD CONSTRAINT balance_change_legacy_pkey
+            PRIMARY KEY USING INDEX balance_change_legacy_pkey_new
+        """
+    )
+    op.execute(
+        """
+        ALTER TABLE balance_change_legacy
+        RENAME CONSTRAINT balance_change_wallet_id_fkey
+        TO balance_change_legacy_wallet_id_fkey
+        """
+    )
+    op.execute(
+        """
+        ALTER INDEX ix_balance_change_wallet_id_created_at_id
+        RENAME TO balance_change_legacy_wallet_id_created_at_id
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE balance_change (
+            id integer NOT NULL DEFAULT nextval('balance_change_id_seq'),
+            created_at timestamp without time zone NOT NULL DEFAULT now(),
+            xid text NOT NULL,
+            reference_id text NOT NULL,
+            type text NOT NULL,
+            wallet_id integer
+                CONSTRAINT balance_change_wallet_id_fkey REFERENCES wallet (id),
+            amount bigint NOT NULL,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("ALTER SEQUENCE balance_change_id_seq OWNED BY balance_change.id")
+    op.create_index(
+        "ix_balance_change_wallet_id_created_at_id",
+        "balance_change",
+        ["wallet_id", "created_at", "id"],
+    )
+    op.create_index(
+        "ix_balance_change_reference_id", "balance_change", ["reference_id"]
+    )
+    op.execute(CLAIM_REFERENCES_TRIGGER.format(table="balance_change"))
+    op.execute(
+        """
+        ALTER TABLE balance_change ATTACH PARTITION balance_change_legacy
+        FOR VALUES FROM (MINVALUE) TO ('{}')
+        """.format(
+            boundary.isoformat(" ")
+        )
+    )
+    op.drop_constraint("balance_change_legacy_bound", "balance_change_legacy")
+    for months in range(PARTITIONS_AHEAD):
+        month = ledger.add_months(boundary, months)
+        op.execute(
+            """
+            CREATE TABLE {name} PARTITION OF balance_change
+            FOR VALUES FROM ('{start}') TO ('{end}')
+            """.format(
+                name=ledger.partition_name("balance_change", month),
+                start=month.isoformat(" "),
+                end=ledger.add_months(month, 1).isoformat(" "),
+            )
+        )
+
+
+def downgrade():
+    # copies the remaining ledger into a plain table under lock, archived
+    # partitions are not restored
+    op.execute(
+        """
+        CREATE TABLE balance_change_plain (
+            id integer NOT NULL DEFAULT nextval('balance_change_id_seq'),
+            created_at timestamp without time zone DEFAULT now(),
+            xid text NOT NULL,
+            reference_id text NOT NULL UNIQUE,
+            type text NOT NULL,
+            wallet_id integer REFERENCES wallet (id),
+            amount bigint NOT NULL
+        )
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO balance_change_plain
+            (id, created_at, xid, reference_id, type, wallet_id, amount)
+        SELECT id, created_at, xid, reference_id, type, wallet_id, amount
+        FROM balance_change
+        """
+    )
+    op.execute("ALTER SEQUENCE balance_change_id_seq OWNED BY balance_change_plain.id")
+    op.drop_table("balance_change")
+    op.execute("DROP FUNCTION claim_balance_change_references()")
+    op.drop_table("balance_change_reference")
+    op.rename_table("balance_change_plain", "balance_change")
+    op.execute(
+        """
+        ALTER TABLE balance_change
+        RENAME CONSTRAINT balance_change_plain_reference_id_key
+        TO balance_change_reference_id_key
+        """
+    )
+    op.execute(
+        """
+        ALTER TABLE balance_change
+        RENAME CONSTRAINT balance_change_plain_wallet_id_fkey
+        TO balance_change_wallet_id_fkey
+        """
+    )
+    op.execute(
+        """
+        ALTER TABLE balance_change
+        ADD CONSTRAINT balance_change_pkey PRIMARY KEY (id)
+        """
+    )
+    op.create_index(
+        "ix_balance_change_wallet_id_created_at_id",
+        "balance_change",
+        ["wallet_id", "created_at", "id"],
+    )
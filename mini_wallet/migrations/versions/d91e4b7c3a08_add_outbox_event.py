@@ -0,0 +1,113 @@
+"""add outbox_event
+
+Events of the balance and status changes, written in the transaction of the
+change by statement triggers on balance_change and status_change, and
+drained by the outbox relay, see mini_wallet/outbox.py. Every write path gets
+its event this way, the asyncio app and the batch endpoints included.
+
+Revision ID: d91e4b7c3a08
+Revises: f18b3c6d2a57
+Create Date: 2026-10-18 18:05:52.106384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "d91e4b7c3a08"
+down_revision = "f18b3c6d2a57"
+branch_labels = None
+depends_on = None
+
+
+BALANCE_CHANGE_EVENTS = """
+    CREATE FUNCTION record_balance_change_events() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO outbox_event (topic, key, payload)
+        SELECT
+            'balance.' || inserted_balance_change.type,
+            wallet.xid,
+            jsonb_build_object(
+                'xid', inserted_balance_change.xid,
+                'wallet', wallet.xid,
+                'customer', customer.xid,
+                'type', inserted_balance_change.type,
+                'amount', inserted_balance_change.amount,
+                'reference_id', inserted_balance_change.reference_id,
+                'created_at', inserted_balance_change.created_at
+            )
+        FROM inserted_balance_change
+        JOIN wallet ON wallet.id = inserted_balance_change.wallet_id
+        JOIN customer ON customer.id = wallet.customer_id
+        ORDER BY inserted_balance_change.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+STATUS_CHANGE_EVENTS = """
+    CREATE FUNCTION record_status_change_events() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO outbox_event (topic, key, payload)
+        SELECT
+            'wallet.' || inserted_status_change.status,
+            wallet.xid,
+            jsonb_build_object(
+                'wallet', wallet.xid,
+                'customer', customer.xid,
+                'status', inserted_status_change.status,
+                'created_at', inserted_status_change.created_at
+            )
+        FROM inserted_status_change
+        JOIN wallet ON wallet.id = inserted_status_change.wallet_id
+        JOIN customer ON customer.id = wallet.customer_id
+        ORDER BY inserted_status_change.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def upgrade():
+    op.create_table(
+        "outbox_event",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("topic", sa.Text(), nullable=False),
+        sa.Column("key", sa.Text(), nullable=False),
+        sa.Column("payload", postgresql.JSONB(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute(BALANCE_CHANGE_EVENTS)
+    op.execute(
+        """
+        CREATE TRIGGER balance_change_outbox
+        AFTER INSERT ON balance_change
+        REFERENCING NEW TABLE AS inserted_balance_change
+        FOR EACH STATEMENT EXECUTE PROCEDURE record_balance_change_events()
+        """
+    )
+    op.execute(STATUS_CHANGE_EVENTS)
+    op.execute(
+        """
+        CREATE TRIGGER status_change_outbox
+        AFTER INSERT ON status_change
+        REFERENCING NEW TABLE AS inserted_status_change
+        FOR EACH STATEMENT EXECUTE PROCEDURE record_status_change_events()
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER status_change_outbox ON status_change")
+    op.execute("DROP FUNCTION record_status_change_events()")
+    op.execute("DROP TRIGGER balance_change_outbox ON balance_change")
+    op.execute("DROP FUNCTION record_balance_change_events()")
+    op.drop_table("outbox_event")
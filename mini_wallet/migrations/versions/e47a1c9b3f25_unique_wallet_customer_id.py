@@ -0,0 +1,73 @@
+"""unique wallet customer_id
+
+enable_or_create upserts on customer_id, which needs the lookup index to be
+unique. The unique index is built concurrently next to the old one and then
+takes its name. Customers with more than one wallet, left by the race the
+upsert removes, have to be merged by hand first.
+
+Revision ID: e47a1c9b3f25
+Revises: b2e8f4a61d09
+Create Date: 2026-10-18 13:05:44.281936
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e47a1c9b3f25"
+down_revision = "b2e8f4a61d09"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    duplicates = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                """
+                SELECT customer_id FROM wallet
+                WHERE customer_id IS NOT NULL
+                GROUP BY customer_id HAVING count(*) > 1
+                """
+            )
+        )
+        .fetchall()
+    )
+    if duplicates:
+        raise RuntimeError(
+            "customers with customer_id in {} have more than one wallet".format(
+                [customer_id for customer_id, in duplicates]
+            )
+        )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_wallet_customer_id_unique",
+            "wallet",
+            ["customer_id"],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_wallet_customer_id", table_name="wallet", postgresql_concurrently=True
+        )
+        op.execute(
+            "ALTER INDEX ix_wallet_customer_id_unique RENAME TO ix_wallet_customer_id"
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_wallet_customer_id_plain",
+            "wallet",
+            ["customer_id"],
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_wallet_customer_id", table_name="wallet", postgresql_concurrently=True
+        )
+        op.execute(
+            "ALTER INDEX ix_wallet_customer_id_plain RENAME TO ix_wallet_customer_id"
+        )
@@ -0,0 +1,34 @@
+"""add wallet_archived_balance
+
+Net of the balance changes of each wallet in the archived balance_change
+partitions, added up by the archive job before a partition is dropped so the
+ledger can still be reconciled against the wallet balances.
+
+Revision ID: f18b3c6d2a57
+Revises: c6f2d8a4e913
+Create Date: 2026-10-18 16:21:07.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f18b3c6d2a57"
+down_revision = "c6f2d8a4e913"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "wallet_archived_balance",
+        sa.Column("wallet_id", sa.Integer(), nullable=False),
+        sa.Column("balance", sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(["wallet_id"], ["wallet.id"]),
+        sa.PrimaryKeyConstraint("wallet_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("wallet_archived_balance")
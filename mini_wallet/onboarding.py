@@ -0,0 +1,129 @@
+"""
+Bulk customer onboarding from CSV or NDJSON customer xids.
+
+The xids are loaded in chunks, each in its own transaction: tokens are
+generated for the whole chunk at once, the chunk is copied into a temporary
+staging table with COPY and merged into customer by a single INSERT ... ON
+CONFLICT DO NOTHING. Results come out in input order as each chunk is
+merged, so both input and output are streamed.
+
+    flask onboard-customers customers.csv tokens.csv
+"""
+import csv
+import io
+import json
+import secrets
+from itertools import islice
+
+from mini_wallet import streaming
+
+
+# as secrets.token_hex(21) of views.initialize_customer
+TOKEN_BYTES = 21
+
+# of the results, as written by write_results
+RESULT_FIELDS = ["customer_xid", "status", "token", "error"]
+
+CREATE_STAGING = """
+    CREATE TEMPORARY TABLE customer_staging (xid text NOT NULL, token text NOT NULL)
+    ON COMMIT DROP
+"""
+
+COPY_STAGING = "COPY customer_staging (xid, token) FROM STDIN WITH (FORMAT csv)"
+
+# sorted so concurrent loads take the unique index locks in the same order;
+# an xid repeated within the chunk is merged once
+MERGE_STAGING = """
+    INSERT INTO customer (xid, token)
+    SELECT DISTINCT ON (xid) xid, token FROM customer_staging ORDER BY xid
+    ON CONFLICT DO NOTHING
+    RETURNING xid, token
+"""
+
+
+def ndjson_xid(line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict):
+        return None
+    return record.get("customer_xid")
+
+
+def read_customer_xids(lines, format_):
+    """customer_xid of each record, None for an unreadable one.
+
+    CSV input needs a customer_xid column, checked right away, NDJSON input
+    has a {"customer_xid": ...} object per line.
+    """
+    if format_ == "csv":
+        reader = csv.DictReader(lines)
+        if "customer_xid" not in (reader.fieldnames or []):
+            raise ValueError("CSV input needs a customer_xid column")
+        return (record["customer_xid"] for record in reader)
+    return (ndjson_xid(line) for line in lines if line.strip())
+
+
+def generate_tokens(count):
+    """count tokens like initialize_customer's, drawn in one call."""
+    random_bytes = secrets.token_bytes(TOKEN_BYTES * count)
+    tokens = []
+    for start in range(0, len(random_bytes), TOKEN_BYTES):
+        end = start + TOKEN_BYTES
+        tokens.append(random_bytes[start:end].hex())
+    return tokens
+
+
+def merge_chunk(engine, chunk):
+    """Create the customers of chunk, yields a result per xid."""
+    valid = [xid for xid in chunk if isinstance(xid, str) and xid]
+    created = dict()
+    if valid:
+        staging = io.StringIO()
+        csv.writer(staging).writerows(zip(valid, generate_tokens(len(valid))))
+        staging.seek(0)
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(CREATE_STAGING)
+            cursor.copy_expert(COPY_STAGING, staging)
+            cursor.execute(MERGE_STAGING)
+            created = dict(cursor.fetchall())
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    for xid in chunk:
+        if not isinstance(xid, str) or not xid:
+            yield {
+                "customer_xid": xid,
+                "status": "failed",
+                "error": "customer_xid is missing",
+            }
+        elif xid in created:
+            yield {"customer_xid": xid, "status": "created", "token": created.pop(xid)}
+        else:
+            yield {
+                "customer_xid": xid,
+                "status": "failed",
+                "error": "customer with customer_id={} already initialized".format(xid),
+            }
+
+
+def onboard_customers(engine, xids, chunk_size=10000):
+    """Create a customer per xid, yields a result per xid in input order."""
+    xids = iter(xids)
+    while True:
+        chunk = list(islice(xids, chunk_size))
+        if not chunk:
+            return
+        yield from merge_chunk(engine, chunk)
+
+
+def write_results(results, format_):
+    """Lines of the results in format_, one of streaming.FORMATS."""
+    return streaming.write_records(results, format_, RESULT_FIELDS)
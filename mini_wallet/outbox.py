@@ -0,0 +1,217 @@
+"""
+Relay of the outbox_event table to a sink.
+
+Balance and status changes write their event to outbox_event in their own
+transaction, through triggers, so an event exists if and only if the change
+was committed. The relay claims the oldest events in batches with FOR UPDATE
+SKIP LOCKED, publishes them and deletes them in the same transaction, so
+several relays drain the outbox side by side without waiting on each other.
+
+Delivery is at least once: a relay failing after publishing leaves the batch
+to be published again. Consumers tell events apart by their id, which
+increases in commit order only roughly, and with several relays events of a
+wallet may arrive out of order.
+
+A sink has a publish(events) method raising on failure, SINKS maps the
+scheme of the OUTBOX_SINK URL to a sink factory:
+
+* file:outbox.ndjson appends the events as NDJSON lines to a local file
+* tcp://host:port sends the NDJSON lines over a TCP connection
+
+    flask relay-outbox --batch-size 500 --metrics-port 9102
+"""
+import json
+import logging
+import os
+import socket
+import time
+from urllib.parse import urlparse
+
+from sqlalchemy import exc
+from sqlalchemy.sql import text
+
+from mini_wallet import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+CLAIM_EVENTS = text(
+    """
+    SELECT id, created_at, topic, key, payload
+    FROM outbox_event
+    ORDER BY id
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+    """
+)
+
+DELETE_EVENTS = text("DELETE FROM outbox_event WHERE id = ANY(:ids)")
+
+# in the time zone of created_at, now() would be the start of the transaction
+PUBLISHED_AT = text("SELECT CAST(clock_timestamp() AS timestamp)")
+
+# estimated from the id range, both ends read off the primary key index
+BACKLOG = text(
+    """
+    SELECT
+        max(id) - min(id) + 1,
+        EXTRACT(
+            EPOCH FROM now() - (
+                SELECT created_at FROM outbox_event ORDER BY id LIMIT 1
+            )
+        )
+    FROM outbox_event
+    """
+)
+
+
+def event_line(event):
+    return (
+        json.dumps(
+            {
+                "id": event["id"],
+                "created_at": event["created_at"].isoformat(),
+                "topic": event["topic"],
+                "key": event["key"],
+                "payload": event["payload"],
+            },
+            separators=(",", ":"),
+        )
+        + "\n"
+    )
+
+
+class FileSink:
+    """Appends the events to a local file, synced after every batch."""
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def from_url(cls, url):
+        return cls(url.path)
+
+    def publish(self, events):
+        with open(self.path, "a") as f:
+            f.writelines(event_line(event) for event in events)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class SocketSink:
+    """Sends the events to a TCP listener, reconnecting after a failure."""
+
+    def __init__(self, host, port, timeout=5.0):
+        self.address = (host, port)
+        self.timeout = timeout
+        self._socket = None
+
+    @classmethod
+    def from_url(cls, url):
+        return cls(url.hostname, url.port)
+
+    def publish(self, events):
+        data = "".join(event_line(event) for event in events).encode()
+        try:
+            if self._socket is None:
+                self._socket = socket.create_connection(self.address, self.timeout)
+            self._socket.sendall(data)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+# scheme of the OUTBOX_SINK URL -> factory of the sink, given the parsed URL
+SINKS = {"file": FileSink.from_url, "tcp": SocketSink.from_url}
+
+
+def make_sink(url):
+    parsed = urlparse(url)
+    factory = SINKS.get(parsed.scheme)
+    if factory is None:
+        raise ValueError(
+            "OUTBOX_SINK={} must start with one of {}".format(
+                url, ", ".join("{}:".format(scheme) for scheme in SINKS)
+            )
+        )
+    return factory(parsed)
+
+
+def relay_batch(engine, sink, batch_size=500):
+    """Publish and delete up to batch_size events, returns how many."""
+    with engine.begin() as connection:
+        events = connection.execute(CLAIM_EVENTS, batch_size=batch_size).fetchall()
+        if not events:
+            return 0
+        with metrics.timed(metrics.outbox_publish):
+            sink.publish(events)
+        connection.execute(DELETE_EVENTS, ids=[event.id for event in events])
+        # lag up to the publication, the commit right after is not counted
+        published_at = connection.execute(PUBLISHED_AT).scalar()
+    for event in events:
+        metrics.outbox_lag.observe((published_at - event.created_at).total_seconds())
+    metrics.outbox_batch_size.observe(len(events))
+    return len(events)
+
+
+def relay(engine, sink, batch_size=500, interval=1.0, once=False):
+    """Drain the outbox, then poll it every interval seconds.
+
+    A failing batch is retried after interval seconds. With once, returns the
+    number of events published when the outbox is found empty.
+    """
+    published = 0
+    while True:
+        try:
+            count = relay_batch(engine, sink, batch_size)
+        except Exception:
+            if once:
+                raise
+            logger.exception("outbox relay fails, retrying")
+            count = 0
+        published += count
+        if count == batch_size:
+            continue
+        if once:
+            return published
+        time.sleep(interval)
+
+
+def backlog(connection):
+    """(estimated pending events, age in seconds of the oldest one or 0).
+
+    The estimate counts the ids skipped by rolled back transactions and the
+    events a concurrent relay is publishing.
+    """
+    pending, age = connection.execute(BACKLOG).first()
+    return pending or 0, float(age or 0)
+
+
+def register_backlog_gauge(engine):
+    """Report the backlog on the metrics of the relay process.
+
+    The series are left out of a scrape while the database is unreachable.
+    """
+
+    def collect():
+        try:
+            with engine.connect() as connection:
+                pending, age = backlog(connection)
+        except exc.DBAPIError:
+            logger.warning("outbox backlog query fails", exc_info=True)
+            return
+        yield ("pending",), pending
+        yield ("oldest_age_seconds",), age
+
+    return metrics.CallbackGauge(
+        "mini_wallet_outbox_backlog",
+        "Estimated outbox events not relayed yet and the age of the oldest one.",
+        ("stat",),
+        collect,
+    )
@@ -0,0 +1,138 @@
+"""
+Reconciliation of the wallet balances against the balance_change ledger.
+
+The balance of a wallet, its shards included, must equal its deposits minus
+its withdrawals, the archived ones included through wallet_archived_balance.
+
+Wallet id ranges are spread over a process pool. Each range is read in a
+read-only repeatable read transaction, balances and ledger sums come from one
+snapshot without taking row locks, and streamed from a server-side cursor in
+chunks, so memory stays flat however many wallets there are.
+
+    flask reconcile-ledger --processes 4 --report mismatches.csv
+"""
+import csv
+import logging
+import multiprocessing
+from functools import partial
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql import text
+
+
+logger = logging.getLogger(__name__)
+
+
+WALLET_IDS = text("SELECT min(id), max(id) FROM wallet")
+
+RECONCILE_RANGE = text(
+    """
+    SELECT
+        wallet.id,
+        wallet.xid,
+        wallet.balance + COALESCE(shard.balance, 0) AS balance,
+        COALESCE(ledger.balance, 0)
+            + COALESCE(wallet_archived_balance.balance, 0) AS ledger_balance
+    FROM wallet
+    LEFT JOIN LATERAL (
+        SELECT CAST(SUM(wallet_balance_shard.balance) AS bigint) AS balance
+        FROM wallet_balance_shard
+        WHERE wallet_balance_shard.wallet_id = wallet.id
+    ) AS shard ON true
+    LEFT JOIN LATERAL (
+        SELECT CAST(
+            SUM(
+                CASE WHEN balance_change.type = 'deposit'
+                THEN balance_change.amount
+                ELSE -balance_change.amount END
+            ) AS bigint
+        ) AS balance
+        FROM balance_change
+        WHERE balance_change.wallet_id = wallet.id
+    ) AS ledger ON true
+    LEFT JOIN wallet_archived_balance
+        ON wallet_archived_balance.wallet_id = wallet.id
+    WHERE wallet.id >= :low AND wallet.id < :high
+    ORDER BY wallet.id
+    """
+).execution_options(stream_results=True)
+
+REPORT_HEADER = ["wallet_id", "wallet_xid", "balance", "ledger_balance", "difference"]
+
+
+def wallet_ranges(low, high, size):
+    """[start, end) id ranges of size ids covering low to high included."""
+    for start in range(low, high + 1, size):
+        yield start, min(start + size, high + 1)
+
+
+# engine of a worker process, see init_worker
+worker_engine = None
+
+
+def init_worker(uri):
+    global worker_engine
+    worker_engine = create_engine(uri, poolclass=NullPool)
+
+
+def reconcile_range(bounds, chunk_size=1000):
+    """(checked, mismatches) of the wallets with an id in bounds."""
+    low, high = bounds
+    checked = 0
+    mismatches = []
+    with worker_engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="REPEATABLE READ")
+        with connection.begin():
+            connection.execute(text("SET TRANSACTION READ ONLY"))
+            # fetched from a server-side cursor
+            result = connection.execute(RECONCILE_RANGE, low=low, high=high)
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if not rows:
+                    break
+                checked += len(rows)
+                mismatches.extend(
+                    (row.id, row.xid, row.balance, row.ledger_balance)
+                    for row in rows
+                    if row.balance != row.ledger_balance
+                )
+    return checked, mismatches
+
+
+def reconcile(
+    uri, report, processes=4, range_size=10000, chunk_size=1000, low=None, high=None,
+):
+    """Write the wallets not matching their ledger to the report CSV file.
+
+    Checks the wallets with an id from low to high, all by default. Returns
+    the number of wallets checked and mismatched.
+    """
+    engine = create_engine(uri, poolclass=NullPool)
+    with engine.connect() as connection:
+        min_id, max_id = connection.execute(WALLET_IDS).first()
+    engine.dispose()
+    low = min_id if low is None else low
+    high = max_id if high is None else high
+
+    checked = mismatched = 0
+    with open(report, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(REPORT_HEADER)
+        if low is None or high is None:
+            return checked, mismatched
+        with multiprocessing.Pool(
+            processes, initializer=init_worker, initargs=(uri,)
+        ) as pool:
+            for range_checked, mismatches in pool.imap_unordered(
+                partial(reconcile_range, chunk_size=chunk_size),
+                wallet_ranges(low, high, range_size),
+            ):
+                checked += range_checked
+                mismatched += len(mismatches)
+                writer.writerows(
+                    (wallet_id, xid, balance, ledger_balance, balance - ledger_balance)
+                    for wallet_id, xid, balance, ledger_balance in mismatches
+                )
+    logger.info("reconciled %s wallets, %s mismatched", checked, mismatched)
+    return checked, mismatched
@@ -0,0 +1,101 @@
+import itertools
+import logging
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy import exc
+from sqlalchemy.sql import text
+
+from mini_wallet import config
+
+
+logger = logging.getLogger(__name__)
+
+
+# seconds the replica is behind, 0 when it has replayed all it received or is
+# not in recovery at all (a plain second instance when testing locally)
+REPLICATION_LAG = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            CAST(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) AS float),
+            CAST('Infinity' AS float)
+        )
+    END
+    """
+)
+
+
+class ReplicaRouter:
+    """Round-robin over the replicas lagging at most max_lag seconds.
+
+    Each replica's lag is checked at most once per check_interval seconds, a
+    replica failing the check or a query is skipped until the next check.
+    """
+
+    def __init__(self, engines, max_lag=1.0, check_interval=1.0, timer=time.monotonic):
+        self.engines = list(engines)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.timer = timer
+        self._cycle = itertools.cycle(self.engines)
+        self._verdicts = dict()
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """A usable replica engine, None when there is none."""
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._cycle)
+            if self.is_usable(engine):
+                return engine
+        return None
+
+    def is_usable(self, engine):
+        with self._lock:
+            checked_at, usable = self._verdicts.get(engine, (None, False))
+            if (
+                checked_at is not None
+                and self.timer() - checked_at < self.check_interval
+            ):
+                return usable
+            # other threads keep the previous verdict while this one checks
+            self._verdicts[engine] = (self.timer(), usable)
+        usable = self.check(engine)
+        with self._lock:
+            self._verdicts[engine] = (self.timer(), usable)
+        return usable
+
+    def check(self, engine):
+        try:
+            with engine.connect() as connection:
+                lag = connection.execute(REPLICATION_LAG).scalar()
+        except exc.DBAPIError:
+            logger.warning("replica %s unreachable", engine.url, exc_info=True)
+            return False
+        if lag > self.max_lag:
+            logger.warning("replica %s lags %s seconds behind", engine.url, lag)
+            return False
+        return True
+
+    def mark_down(self, engine):
+        with self._lock:
+            self._verdicts[engine] = (self.timer(), False)
+
+
+def from_config(app_config):
+    engines = []
+    for uri in app_config["DB_REPLICA_URIS"].split(","):
+        if not uri.strip():
+            continue
+        engine = create_engine(uri.strip(), **config.engine_options(app_config))
+        config.instrument_engine(engine, app_config)
+        engines.append(engine)
+    return ReplicaRouter(
+        engines,
+        max_lag=app_config["DB_REPLICA_MAX_LAG"],
+        check_interval=app_config["DB_REPLICA_CHECK_INTERVAL"],
+    )
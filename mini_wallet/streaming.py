@@ -0,0 +1,29 @@
+"""
+CSV and NDJSON output written a record at a time, for streamed responses and
+files of any length.
+"""
+import csv
+import io
+import json
+
+
+FORMATS = ("csv", "ndjson")
+
+MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def write_records(records, format_, fields):
+    """Lines of the record dicts in format_, CSV with a header of fields."""
+    if format_ == "ndjson":
+        for record in records:
+            yield json.dumps(record) + "\n"
+        return
+    line = io.StringIO()
+    writer = csv.DictWriter(line, fields)
+    writer.writeheader()
+    for record in records:
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+        writer.writerow(record)
+    yield line.getvalue()
@@ -0,0 +1,93 @@
+"""
+Commits saved by grouping concurrent deposits to one wallet.
+
+Runs --concurrency threads depositing into one wallet for --duration seconds
+against the local DB, first one commit per deposit and then with the deposits
+of a --window milliseconds window applied with one lock and one commit.
+
+    python -m tests.benchmark.bench_group_commit --concurrency 32 --window 2
+"""
+import argparse
+import threading
+import time
+import uuid
+
+from sqlalchemy import event
+
+from mini_wallet import views
+from mini_wallet.group_commit import GroupCommitter
+from tests.benchmark.common import print_results
+from tests.benchmark.common import summarize
+
+
+def deposit_for(customer_dict, deadline, latencies, lock):
+    local_latencies = []
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        views.deposit_money(customer_dict, 1, str(uuid.uuid4()))
+        local_latencies.append(time.perf_counter() - started)
+    with lock:
+        latencies.extend(local_latencies)
+
+
+def run(customer_dict, concurrency, duration, commits):
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    commits_before = commits[0]
+    threads = [
+        threading.Thread(
+            target=deposit_for, args=(customer_dict, deadline, latencies, lock)
+        )
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies)
+    result["deposits_per_second"] = len(latencies) / duration
+    result["commits_per_second"] = (commits[0] - commits_before) / duration
+    result["commits_per_deposit"] = (commits[0] - commits_before) / len(latencies)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--window", type=float, default=2.0)
+    parser.add_argument("--max-size", type=int, default=100)
+    args = parser.parse_args()
+
+    views.app.config["SQLALCHEMY_ECHO"] = False
+    views.app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"] = args.concurrency
+    views.migrate_db()
+    token = views.initialize_customer(str(uuid.uuid4()))["token"]
+    customer_dict = views.get_customer_info_by_token(token)
+    views.enable_or_create(customer_dict)
+
+    commits = [0]
+
+    @event.listens_for(views.db.engine, "commit")
+    def count_commit(connection):
+        commits[0] += 1
+
+    results = dict()
+    views.deposit_group_commit = None
+    results["per_deposit"] = run(
+        customer_dict, args.concurrency, args.duration, commits
+    )
+    views.deposit_group_commit = GroupCommitter(
+        views.apply_grouped_deposits, window=args.window / 1000, max_size=args.max_size,
+    )
+    results["grouped"] = run(customer_dict, args.concurrency, args.duration, commits)
+    results["commits_saved_per_second"] = (
+        results["grouped"]["deposits_per_second"]
+        - results["grouped"]["commits_per_second"]
+    )
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
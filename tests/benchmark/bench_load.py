@@ -0,0 +1,163 @@
+"""
+Concurrent load test of a live mini wallet.
+
+Drives the API with --concurrency workers for --duration seconds in two
+scenarios: spread over --wallets wallets, and all on a single hot wallet.
+Reports requests per second and p50/p95/p99 per endpoint, saves them as JSON
+and compares against an earlier run. The app is run without admission
+control, requests it turns away with a 429 are reported as throttled.
+
+    env MINI_WALLET_RATE_LIMIT_BACKEND=none FLASK_APP=mini_wallet/views.py \
+        flask run --with-threads
+    python -m tests.benchmark.bench_load --concurrency 32 --output run.json
+    python -m tests.benchmark.bench_load --concurrency 32 --compare run.json
+"""
+import argparse
+import json
+import random
+import subprocess
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from tests.benchmark.common import print_results
+from tests.benchmark.common import summarize
+from tests.integration.test_mini_wallet import MiniWalletRequests
+
+
+OPERATIONS = (("deposit", 4), ("withdraw", 2), ("view", 4))
+INITIAL_BALANCE = 10 ** 12
+
+
+def create_wallets(base_url, count):
+    tokens = []
+    for _ in range(count):
+        client = MiniWalletRequests(base_url)
+        client.initialize(str(uuid.uuid4())).raise_for_status()
+        client.enable().raise_for_status()
+        client.deposit(INITIAL_BALANCE, str(uuid.uuid4())).raise_for_status()
+        tokens.append(client.token)
+    return tokens
+
+
+def call(client, operation):
+    if operation == "deposit":
+        return client.deposit(random.randint(1, 1000), str(uuid.uuid4()))
+    if operation == "withdraw":
+        return client.withdraw(1, str(uuid.uuid4()))
+    return client.view()
+
+
+def worker(base_url, tokens, deadline, samples, lock):
+    clients = [MiniWalletRequests(base_url, token) for token in tokens]
+    operations, weights = zip(*OPERATIONS)
+    local_samples = []
+    while time.monotonic() < deadline:
+        client = random.choice(clients)
+        operation = random.choices(operations, weights)[0]
+        started = time.perf_counter()
+        try:
+            status = call(client, operation).status_code
+        except Exception:
+            status = None
+        local_samples.append((operation, time.perf_counter() - started, status))
+    with lock:
+        samples.extend(local_samples)
+
+
+def run_scenario(base_url, tokens, concurrency, duration):
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker, base_url, tokens, deadline, samples, lock)
+
+    by_operation = defaultdict(list)
+    errors = defaultdict(int)
+    throttled = defaultdict(int)
+    for operation, latency, status in samples:
+        by_operation[operation].append(latency)
+        if status == 429:
+            throttled[operation] += 1
+        elif status is None or status >= 300:
+            errors[operation] += 1
+    results = {"rps": len(samples) / duration, "endpoints": dict()}
+    for operation, latencies in sorted(by_operation.items()):
+        result = summarize(latencies)
+        result["rps"] = len(latencies) / duration
+        result["errors"] = errors[operation]
+        result["throttled"] = throttled[operation]
+        results["endpoints"][operation] = result
+    return results
+
+
+def compare(results, baseline):
+    """Ratios of this run against the baseline, > 1 means faster or higher."""
+    comparison = dict()
+    for scenario, result in results["scenarios"].items():
+        previous = baseline["scenarios"].get(scenario)
+        if not previous:
+            continue
+        comparison[scenario] = {"rps": result["rps"] / previous["rps"]}
+        for operation, endpoint in result["endpoints"].items():
+            previous_endpoint = previous["endpoints"].get(operation)
+            if previous_endpoint:
+                comparison[scenario][operation] = {
+                    "rps": endpoint["rps"] / previous_endpoint["rps"],
+                    "p99": previous_endpoint["p99_ms"] / endpoint["p99_ms"],
+                }
+    return comparison
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"]).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--wallets", type=int, default=100)
+    parser.add_argument(
+        "--scenario", choices=["spread", "hot"], action="append", dest="scenarios"
+    )
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "wallets": args.wallets,
+        },
+        "scenarios": dict(),
+    }
+    tokens = create_wallets(args.base_url, args.wallets)
+    for scenario in args.scenarios or ["spread", "hot"]:
+        scenario_tokens = tokens if scenario == "spread" else tokens[:1]
+        results["scenarios"][scenario] = run_scenario(
+            args.base_url, scenario_tokens, args.concurrency, args.duration
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            results["comparison"] = compare(results, json.load(f))
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
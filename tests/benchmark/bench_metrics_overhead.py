@@ -0,0 +1,80 @@
+"""
+Overhead of the always-on metrics of mini_wallet/metrics.py.
+
+Times a single Histogram.observe, then GET /api/v1/wallet through the Flask
+test client against the local DB with MINI_WALLET_METRICS_ENABLED on and off,
+each in its own process as the hooks are registered at import time.
+
+    python -m tests.benchmark.bench_metrics_overhead --requests 5000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import timeit
+import uuid
+
+from tests.benchmark.common import print_results
+from tests.benchmark.common import summarize
+
+
+MODULE = "tests.benchmark.bench_metrics_overhead"
+
+
+def time_requests(count):
+    from mini_wallet import views
+
+    views.migrate_db()
+    token = views.initialize_customer(str(uuid.uuid4()))["token"]
+    headers = {"Authorization": "Token {}".format(token)}
+    latencies = []
+    with views.app.test_client() as client:
+        client.post("/api/v1/wallet", headers=headers)
+        for _ in range(count):
+            started = timeit.default_timer()
+            response = client.get("/api/v1/wallet", headers=headers)
+            latencies.append(timeit.default_timer() - started)
+            assert response.status_code == 200
+    return summarize(latencies)
+
+
+def run_child(metrics_enabled, count):
+    environ = dict(os.environ, MINI_WALLET_METRICS_ENABLED=str(metrics_enabled))
+    output = subprocess.check_output(
+        [sys.executable, "-m", MODULE, "--child", "--requests", str(count)],
+        env=environ,
+    )
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(time_requests(args.requests)))
+        return
+
+    from mini_wallet import metrics
+
+    histogram = metrics.Histogram("bench_seconds", "benchmark", labelnames=("route",))
+    observations = 100000
+    observe_seconds = timeit.timeit(
+        lambda: histogram.observe(0.003, ("/api/v1/wallet",)), number=observations
+    )
+    results = {
+        "observe_us": 1000000 * observe_seconds / observations,
+        "metrics_off": run_child(False, args.requests),
+        "metrics_on": run_child(True, args.requests),
+    }
+    results["overhead_per_request_ms"] = (
+        results["metrics_on"]["mean_ms"] - results["metrics_off"]["mean_ms"]
+    )
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
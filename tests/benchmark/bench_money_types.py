@@ -0,0 +1,103 @@
+"""
+numeric versus bigint money columns.
+
+Builds the same ledger (--wallets wallets, --rows balance changes) twice in
+temporary tables of the local DB, once with numeric and once with bigint
+amounts, and compares their size, a full ledger scan summing amounts per
+wallet, reading the amounts into Python, and --updates balance updates.
+
+    python -m tests.benchmark.bench_money_types --rows 2000000
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy.sql import text
+
+from mini_wallet import views
+from tests.benchmark.common import print_results
+from tests.benchmark.common import summarize
+from tests.benchmark.common import time_calls
+
+
+SETUP = """
+    CREATE TEMPORARY TABLE wallet_{type} (
+        id integer PRIMARY KEY, balance {type} NOT NULL
+    );
+    CREATE TEMPORARY TABLE balance_change_{type} (
+        id serial PRIMARY KEY, wallet_id integer NOT NULL, amount {type} NOT NULL
+    );
+    INSERT INTO wallet_{type}
+    SELECT i, 0 FROM generate_series(1, :wallets) i;
+    INSERT INTO balance_change_{type} (wallet_id, amount)
+    SELECT 1 + i % :wallets, 1000 * (1 + i % 5000)
+    FROM generate_series(1, :rows) i;
+    ANALYZE wallet_{type};
+    ANALYZE balance_change_{type};
+"""
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return 1000 * (time.perf_counter() - started)
+
+
+def run(connection, type_, args):
+    connection.execute(
+        text(SETUP.format(type=type_)), wallets=args.wallets, rows=args.rows
+    )
+    result = dict()
+    result["ledger_bytes"] = connection.execute(
+        text("SELECT pg_table_size('balance_change_{}')".format(type_))
+    ).scalar()
+    result["scan_ms"] = timed(
+        lambda: connection.execute(
+            text(
+                "SELECT wallet_id, sum(amount) FROM balance_change_{} "
+                "GROUP BY wallet_id".format(type_)
+            )
+        ).fetchall()
+    )
+    result["fetch_and_sum_ms"] = timed(
+        lambda: sum(
+            amount
+            for amount, in connection.execute(
+                text("SELECT amount FROM balance_change_{}".format(type_))
+            )
+        )
+    )
+    update = text(
+        "UPDATE wallet_{} SET balance = balance + :delta WHERE id = :id".format(type_)
+    )
+    random.seed(0)
+    result["balance_update"] = summarize(
+        time_calls(
+            lambda i: connection.execute(update, delta=1000, id=i),
+            [(random.randint(1, args.wallets),) for _ in range(args.updates)],
+        )
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--wallets", type=int, default=10000)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--updates", type=int, default=5000)
+    args = parser.parse_args()
+
+    views.app.config["SQLALCHEMY_ECHO"] = False
+    results = dict()
+    with views.db.engine.connect() as connection:
+        for type_ in ("numeric", "bigint"):
+            results[type_] = run(connection, type_, args)
+    results["bigint_vs_numeric"] = {
+        key: results["bigint"][key] / results["numeric"][key]
+        for key in ("ledger_bytes", "scan_ms", "fetch_and_sum_ms")
+    }
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
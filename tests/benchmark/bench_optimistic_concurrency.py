@@ -0,0 +1,107 @@
+"""
+Locking against optimistic WALLET_CONCURRENCY_MODE, at low and high contention.
+
+Runs --concurrency threads applying single item batches, deposits and
+withdrawals in turn, for --duration seconds against the local DB: each thread
+on a wallet of its own (low contention) and all threads on one wallet (high
+contention), in both modes. Reports throughput, latency, and for the
+optimistic mode the version conflicts and the batches that ended up locking
+the wallet.
+
+    python -m tests.benchmark.bench_optimistic_concurrency --concurrency 32
+"""
+import argparse
+import threading
+import time
+import uuid
+
+from mini_wallet import metrics
+from mini_wallet import views
+from tests.benchmark.common import print_results
+from tests.benchmark.common import summarize
+
+
+INITIAL_BALANCE = 10 ** 12
+
+OPERATIONS = ("deposit_batch", "withdrawal_batch")
+
+
+def create_wallet():
+    token = views.initialize_customer(str(uuid.uuid4()))["token"]
+    customer_dict = views.get_customer_info_by_token(token)
+    views.enable_or_create(customer_dict)
+    views.deposit_money(customer_dict, INITIAL_BALANCE, str(uuid.uuid4()))
+    return customer_dict
+
+
+def apply_for(customer_dict, deadline, latencies, lock):
+    local_latencies = []
+    type_ = "deposit"
+    while time.monotonic() < deadline:
+        items = [{"amount": 1, "reference_id": str(uuid.uuid4())}]
+        started = time.perf_counter()
+        views.apply_balance_changes(customer_dict, items, type_)
+        local_latencies.append(time.perf_counter() - started)
+        type_ = "withdrawal" if type_ == "deposit" else "deposit"
+    with lock:
+        latencies.extend(local_latencies)
+
+
+def conflict_totals():
+    totals = {"conflicts": 0, "locked": 0}
+    for operation in OPERATIONS:
+        for outcome in ("completed", "locked"):
+            snapshot = metrics.wallet_version_conflicts.snapshot((operation, outcome))
+            totals["conflicts"] += int(snapshot["sum"])
+            if outcome == "locked":
+                totals["locked"] += snapshot["count"]
+    return totals
+
+
+def run(customer_dicts, duration):
+    latencies = []
+    lock = threading.Lock()
+    before = conflict_totals()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=apply_for, args=(customer_dict, deadline, latencies, lock)
+        )
+        for customer_dict in customer_dicts
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies)
+    result["batches_per_second"] = len(latencies) / duration
+    after = conflict_totals()
+    for key in after:
+        result[key] = after[key] - before[key]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    views.app.config["SQLALCHEMY_ECHO"] = False
+    views.app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"] = args.concurrency
+    views.migrate_db()
+    wallets = [create_wallet() for _ in range(args.concurrency)]
+    scenarios = {"low": wallets, "high": [wallets[0]] * args.concurrency}
+
+    results = dict()
+    for contention, customer_dicts in scenarios.items():
+        for mode in ("pessimistic", "optimistic"):
+            views.app.config["WALLET_CONCURRENCY_MODE"] = mode
+            results["{}_{}".format(contention, mode)] = run(
+                customer_dicts, args.duration
+            )
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+CPU time and memory of the read hot paths: ORM queries, Core statements
+compiled on every call, and the precompiled Core statements of views.py.
+
+Runs the token lookup and the wallet view query --calls times each against
+the local DB, bypassing the caches, with the session removed after each call
+like at the end of a request. The CPU time is the client side only, the peak
+memory is traced with tracemalloc in a separate pass of --traced-calls calls.
+
+    python -m tests.benchmark.bench_read_paths --calls 5000
+"""
+import argparse
+import time
+import tracemalloc
+import uuid
+
+from sqlalchemy.orm import joinedload
+
+from mini_wallet import views
+from tests.benchmark.common import print_results
+
+
+def token_orm(session, token, customer_id):
+    customer = (
+        session.query(views.Customer)
+        .filter(views.Customer.token == token)
+        .one_or_none()
+    )
+    return {"id": customer.id, "xid": customer.xid}
+
+
+def token_core(session, token, customer_id):
+    row = session.execute(views.CUSTOMER_BY_TOKEN, {"token": token}).first()
+    return views.CustomerContext(row.id, row.xid)
+
+
+def token_compiled(session, token, customer_id):
+    row = views.execute_compiled(
+        session, views.CUSTOMER_BY_TOKEN, {"token": token}
+    ).first()
+    return views.CustomerContext(row.id, row.xid)
+
+
+def wallet_orm(session, token, customer_id):
+    wallet = (
+        session.query(views.Wallet)
+        .filter_by(customer_id=customer_id)
+        .options(joinedload(views.Wallet.customer))
+        .one_or_none()
+    )
+    return {
+        "id": wallet.id,
+        "xid": wallet.xid,
+        "status": wallet.status,
+        "balance": wallet.total_balance,
+        "customer_xid": wallet.customer.xid,
+    }
+
+
+def wallet_core(session, token, customer_id):
+    return views.wallet_view(
+        session.execute(views.FIND_WALLET, {"customer_id": customer_id}).first()
+    )
+
+
+def wallet_compiled(session, token, customer_id):
+    return views.wallet_view(
+        views.execute_compiled(
+            session, views.FIND_WALLET, {"customer_id": customer_id}
+        ).first()
+    )
+
+
+PATHS = {
+    "token": {"orm": token_orm, "core": token_core, "compiled": token_compiled},
+    "wallet": {"orm": wallet_orm, "core": wallet_core, "compiled": wallet_compiled},
+}
+
+
+def call(path, token, customer_id):
+    try:
+        return path(views.db.session, token, customer_id)
+    finally:
+        views.db.session.remove()
+
+
+def measure(path, token, customer_id, calls, traced_calls):
+    for _ in range(100):
+        call(path, token, customer_id)
+    started = time.process_time()
+    for _ in range(calls):
+        call(path, token, customer_id)
+    cpu = time.process_time() - started
+
+    peaks = []
+    tracemalloc.start()
+    for _ in range(traced_calls):
+        tracemalloc.clear_traces()
+        call(path, token, customer_id)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    return {
+        "cpu_us_per_call": round(1e6 * cpu / calls, 1),
+        "peak_kib_per_call": round(sum(peaks) / len(peaks) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--traced-calls", type=int, default=200)
+    args = parser.parse_args()
+
+    views.migrate_db()
+    token = views.initialize_customer(str(uuid.uuid4()))["token"]
+    customer_dict = views.get_customer_info_by_token(token)
+    views.enable_or_create(customer_dict)
+
+    results = dict()
+    for name, variants in PATHS.items():
+        for variant, path in variants.items():
+            results["{}_{}".format(name, variant)] = measure(
+                path, token, customer_dict["id"], args.calls, args.traced_calls
+            )
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Deposit throughput of a single hot wallet, single-row versus split balance.
+
+Runs --concurrency threads depositing into one wallet for --duration seconds
+against the local DB, first with the balance on the wallet row and then split
+over --shards rows with set_wallet_shards, and checks no deposit was lost.
+
+    python -m tests.benchmark.bench_sharded_wallet --concurrency 32 --shards 16
+"""
+import argparse
+import threading
+import time
+import uuid
+
+from mini_wallet import views
+from tests.benchmark.common import print_results
+from tests.benchmark.common import summarize
+
+
+def deposit_for(customer_dict, deadline, latencies, lock):
+    local_latencies = []
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        views.deposit_money(customer_dict, 1, str(uuid.uuid4()))
+        local_latencies.append(time.perf_counter() - started)
+    with lock:
+        latencies.extend(local_latencies)
+
+
+def run(customer_dict, concurrency, duration):
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=deposit_for, args=(customer_dict, deadline, latencies, lock)
+        )
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies)
+    result["deposits_per_second"] = len(latencies) / duration
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--shards", type=int, default=16)
+    args = parser.parse_args()
+
+    views.app.config["SQLALCHEMY_ECHO"] = False
+    # one connection per thread, so the wallet lock and not the pool is measured
+    views.app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"] = args.concurrency
+    views.migrate_db()
+    token = views.initialize_customer(str(uuid.uuid4()))["token"]
+    customer_dict = views.get_customer_info_by_token(token)
+    views.enable_or_create(customer_dict)
+
+    results = dict()
+    for name, shard_count in (("single_row", 0), ("sharded", args.shards)):
+        views.set_wallet_shards(customer_dict["id"], shard_count)
+        results[name] = run(customer_dict, args.concurrency, args.duration)
+    deposited = sum(result["count"] for result in results.values())
+    balance = views.get_balance(customer_dict)["wallet"]["balance"]
+    assert balance == deposited, (balance, deposited)
+    results["speedup"] = (
+        results["sharded"]["deposits_per_second"]
+        / results["single_row"]["deposits_per_second"]
+    )
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Time to first byte and memory of GET /api/v1/wallet/statement on a wallet
+with a long ledger, against loading the same ledger through the ORM.
+
+Seeds the local DB with a wallet of --rows balance changes, then streams its
+statement through the Flask test client. Memory is the tracemalloc peak while
+the whole statement is read.
+
+    python -m tests.benchmark.bench_statement_export --rows 1000000
+"""
+import argparse
+import time
+import tracemalloc
+import uuid
+
+from sqlalchemy.sql import text
+
+from mini_wallet import views
+from tests.benchmark.common import print_results
+
+
+SEED = text(
+    """
+    WITH seeded AS (
+        INSERT INTO balance_change (xid, amount, reference_id, type, wallet_id)
+        SELECT :run || '-' || i, 1, :run || '-' || i, 'deposit', :wallet_id
+        FROM generate_series(1, :rows) i
+    )
+    UPDATE wallet SET balance = balance + :rows WHERE id = :wallet_id
+    """
+)
+
+
+def seed(rows):
+    token = views.initialize_customer(str(uuid.uuid4()))["token"]
+    customer_dict = views.get_customer_info_by_token(token)
+    views.enable_or_create(customer_dict)
+    wallet_id = views.find_wallet(customer_dict["id"])["id"]
+    with views.db.engine.begin() as connection:
+        connection.execute(
+            SEED, run="bench-{}".format(uuid.uuid4()), wallet_id=wallet_id, rows=rows
+        )
+    return token, wallet_id
+
+
+def stream_statement(token, format_):
+    headers = {"Authorization": "Token {}".format(token)}
+    tracemalloc.start()
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    with views.app.test_client() as client:
+        response = client.get(
+            "/api/v1/wallet/statement",
+            query_string={"format": format_},
+            headers=headers,
+            buffered=False,
+        )
+        for chunk in response.response:
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            size += len(chunk)
+        response.close()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "first_byte_ms": round(1000 * first_byte, 1),
+        "total_s": round(elapsed, 2),
+        "mib": round(size / 2 ** 20, 1),
+        "peak_mib": round(peak / 2 ** 20, 1),
+    }
+
+
+def load_orm(wallet_id):
+    tracemalloc.start()
+    started = time.perf_counter()
+    changes = (
+        views.BalanceChange.query.filter_by(wallet_id=wallet_id)
+        .order_by(views.BalanceChange.created_at, views.BalanceChange.id)
+        .all()
+    )
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    views.db.session.remove()
+    return {
+        "rows": len(changes),
+        "total_s": round(elapsed, 2),
+        "peak_mib": round(peak / 2 ** 20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    views.migrate_db()
+    token, wallet_id = seed(args.rows)
+    print_results(
+        {
+            "statement_csv": stream_statement(token, "csv"),
+            "statement_ndjson": stream_statement(token, "ndjson"),
+            "orm_load": load_orm(wallet_id),
+        }
+    )
+
+
+if __name__ == "__main__":
+    main()
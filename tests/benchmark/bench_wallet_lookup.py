@@ -0,0 +1,135 @@
+"""
+Wallet lookup latency without and with the lookup indexes.
+
+Creates a throwaway database next to the local DB (see docker-compose.yml),
+migrates it to the baseline revision, seeds it with --wallets wallets and
+--changes balance changes per wallet, then times the lookups of the hot paths
+at the baseline revision and again after the index migration. The database is
+dropped afterwards, the local DB is left untouched.
+
+    python -m tests.benchmark.bench_wallet_lookup --wallets 1000000
+"""
+import argparse
+import random
+import uuid
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.sql import text
+
+from mini_wallet import views
+from tests.benchmark.common import print_results
+from tests.benchmark.common import summarize
+from tests.benchmark.common import time_calls
+
+
+BASELINE_REVISION = "3f1c2a9d8b7e"
+INDEX_REVISION = "8d4e6b1f2c3a"
+
+SEED = text(
+    """
+    WITH new_customer AS (
+        INSERT INTO customer (xid, token)
+        SELECT :run || '-' || i, :run || '-token-' || i
+        FROM generate_series(1, :wallets) i
+        RETURNING id
+    ), new_wallet AS (
+        INSERT INTO wallet (xid, balance, status, customer_id)
+        SELECT :run || '-' || id, 0, 'enabled', id FROM new_customer
+        RETURNING id
+    ), new_status_change AS (
+        INSERT INTO status_change (status, wallet_id)
+        SELECT 'enabled', id FROM new_wallet
+    )
+    INSERT INTO balance_change (xid, amount, reference_id, type, wallet_id)
+    SELECT :run || '-' || w.id || '-' || c, 1, :run || '-' || w.id || '-' || c,
+        'deposit', w.id
+    FROM new_wallet w, generate_series(1, :changes) c
+    """
+)
+
+LOOKUPS = {
+    "wallet_by_customer_id": text(
+        "SELECT id, xid, status, balance FROM wallet WHERE customer_id = :id"
+    ),
+    "status_change_by_wallet_id": text(
+        "SELECT id, status FROM status_change WHERE wallet_id = :id"
+    ),
+    "balance_change_history": text(
+        """
+        SELECT id, amount, type, created_at FROM balance_change
+        WHERE wallet_id = :id ORDER BY created_at DESC LIMIT 20
+        """
+    ),
+}
+
+
+def seed(wallets, changes):
+    with views.db.engine.begin() as connection:
+        run = "bench-{}".format(uuid.uuid4())
+        connection.execute(SEED, run=run, wallets=wallets, changes=changes)
+        connection.execute(text("ANALYZE"))
+        return connection.execute(
+            text("SELECT min(customer_id), max(customer_id) FROM wallet")
+        ).first()
+
+
+@contextmanager
+def throwaway_database():
+    """Point the app at a new database on the server of its own, dropped after."""
+    original = views.app.config["SQLALCHEMY_DATABASE_URI"]
+    url = make_url(original)
+    name = "{}_bench_{}".format(url.database, uuid.uuid4().hex[:8])
+    server = create_engine(url, isolation_level="AUTOCOMMIT")
+    with server.connect() as connection:
+        connection.execute(text('CREATE DATABASE "{}"'.format(name)))
+    url.database = name
+    views.app.config["SQLALCHEMY_DATABASE_URI"] = str(url)
+    try:
+        yield name
+    finally:
+        # the connections to the throwaway database are closed before the drop
+        views.db.engine.dispose()
+        views.app.config["SQLALCHEMY_DATABASE_URI"] = original
+        with server.connect() as connection:
+            connection.execute(text('DROP DATABASE "{}"'.format(name)))
+        server.dispose()
+
+
+def time_lookups(ids):
+    results = dict()
+    with views.db.engine.connect() as connection:
+        for name, statement in LOOKUPS.items():
+            results[name] = summarize(
+                time_calls(
+                    lambda i: connection.execute(statement, id=i).fetchall(),
+                    [(i,) for i in ids],
+                )
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--wallets", type=int, default=200000)
+    parser.add_argument("--changes", type=int, default=10)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    views.app.config["SQLALCHEMY_ECHO"] = False
+    with throwaway_database():
+        views.upgrade_db(BASELINE_REVISION)
+        low, high = seed(args.wallets, args.changes)
+        ids = [random.randint(low, high) for _ in range(args.lookups)]
+
+        results = {"before": time_lookups(ids)}
+        views.upgrade_db(INDEX_REVISION)
+        with views.db.engine.begin() as connection:
+            connection.execute(text("ANALYZE"))
+        results["after"] = time_lookups(ids)
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
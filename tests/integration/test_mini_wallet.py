@@ -3,28 +3,55 @@ import uuid
 import logging
 
 
-def get_mini_wallet_api():
-    return MiniWalletRequests()
+def get_mini_wallet_api(base_url="http://127.0.0.1:5000"):
+    return MiniWalletRequests(base_url)
 
 
 class MiniWalletRequests:
-    def __init__(self, base_url):
-        self.base_url = base_url
-
-    def initialize(customer_xid):
-        pass
-
-    def enable():
-        pass
+    """Client of a live mini wallet, keeps its connection alive between calls."""
 
-    def deposit(amount, reference_id):
-        pass
-
-    def withdraw(amount, reference_id):
-        pass
-
-    def disable():
-        pass
+    def __init__(self, base_url, token=None):
+        self.base_url = base_url
+        self.token = token
+        self.session = requests.Session()
+
+    def request(self, method, path, **kwargs):
+        if self.token:
+            kwargs.setdefault("headers", {})["Authorization"] = "Token {}".format(
+                self.token
+            )
+        return self.session.request(method, self.base_url + path, **kwargs)
+
+    def initialize(self, customer_xid):
+        response = self.request(
+            "POST", "/api/v1/init", json={"customer_xid": customer_xid}
+        )
+        if response.status_code == 201:
+            self.token = response.json()["data"]["token"]
+        return response
+
+    def enable(self):
+        return self.request("POST", "/api/v1/wallet")
+
+    def view(self):
+        return self.request("GET", "/api/v1/wallet")
+
+    def deposit(self, amount, reference_id):
+        return self.request(
+            "POST",
+            "/api/v1/wallet/deposits",
+            data={"amount": amount, "reference_id": reference_id},
+        )
+
+    def withdraw(self, amount, reference_id):
+        return self.request(
+            "POST",
+            "/api/v1/wallet/withdrawals",
+            data={"amount": amount, "reference_id": reference_id},
+        )
+
+    def disable(self):
+        return self.request("PATCH", "/api/v1/wallet", data={"is_disabled": True})
 
 
 class BaseMiniWalletResponse: